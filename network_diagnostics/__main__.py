@@ -1,17 +1,12 @@
 import sys
 
-import filelock
-
-from .gui.gui import gui_main
 from .logging_ import setup_logging
-from .utils import create_app_dirs, get_file_lock, get_logs_dir
+from .utils import create_app_dirs, get_instance_lock, get_logs_dir
 
 
-# Acquire file lock to limit the program to a single instance
-try:
-    lock = get_file_lock()
-    lock.acquire()
-except filelock.Timeout:
+# Acquire instance lock to limit the program to a single instance
+lock = get_instance_lock()
+if not lock.acquire():
     print('Another instance is already running')
     sys.exit(1)
 
@@ -34,4 +29,7 @@
 setup_logging(logs_dir)
 
 
+# The GUI and diagnostics modules are heavy to import, so they are only imported once this is the only instance
+from .gui.gui import gui_main
+
 gui_main()
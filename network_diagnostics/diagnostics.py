@@ -1,8 +1,21 @@
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import ctypes
 import datetime
+import functools
 import logging
+import math
+import os
+import queue
+import sched
+import selectors
+import socket
 import threading
 import time
-import xml.dom.minidom
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
 
 import cfspeedtest
 import icmplib
@@ -13,7 +26,7 @@
 import subprocess
 
 from .logging_ import setup_diagnostics_logging
-from .utils import get_diagnostics_dir, create_firewall_rules, remove_firewall_rules
+from .utils import get_diagnostics_dir, ensure_firewall_rules, remove_firewall_rules
 
 
 log = logging.getLogger('diagnostics')
@@ -21,6 +34,145 @@
 log_tests = logging.getLogger('tests')
 log_event_log = logging.getLogger('event-log')
 
+# Short-lived background work such as the tests on interruption, traceroutes and speed tests runs on a shared pool
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix='diagnostics')
+
+
+def _ensure_firewall_rules():
+    # The firewall rules are kept for the lifetime of the process, so that restarting doesn't modify them again
+    if ensure_firewall_rules():
+        atexit.register(_remove_firewall_rules)
+
+
+def _remove_firewall_rules():
+    try:
+        remove_firewall_rules()
+    except OSError as e:
+        log.debug('Error removing firewall rules', exc_info=True)
+        log.error(f'Failed to remove firewall rules: {e}')
+
+
+_resolve_cache = {}
+_resolve_cache_lock = threading.Lock()
+_resolve_cache_ttl = 300.0
+
+
+def _resolve_address(host):
+    if not icmplib.utils.is_hostname(host):
+        return host
+
+    # Tests are restarted often with the same hosts, so resolved addresses are reused for a while
+    now = time.monotonic()
+    with _resolve_cache_lock:
+        cached = _resolve_cache.get(host)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    address = icmplib.utils.resolve(host)[0]
+    with _resolve_cache_lock:
+        _resolve_cache[host] = (address, now + _resolve_cache_ttl)
+    return address
+
+
+class _IPAdapterAddresses(ctypes.Structure):
+    pass
+
+
+# Leading fields of IP_ADAPTER_ADDRESSES, only the ones up to the friendly name are read
+_IPAdapterAddresses._fields_ = (
+    ('Length', ctypes.c_ulong),
+    ('IfIndex', ctypes.c_ulong),
+    ('Next', ctypes.POINTER(_IPAdapterAddresses)),
+    ('AdapterName', ctypes.c_char_p),
+    ('FirstUnicastAddress', ctypes.c_void_p),
+    ('FirstAnycastAddress', ctypes.c_void_p),
+    ('FirstMulticastAddress', ctypes.c_void_p),
+    ('FirstDnsServerAddress', ctypes.c_void_p),
+    ('DnsSuffix', ctypes.c_wchar_p),
+    ('Description', ctypes.c_wchar_p),
+    ('FriendlyName', ctypes.c_wchar_p)
+)
+
+_AF_UNSPEC = 0
+_GAA_FLAG_SKIP_UNICAST = 0x1
+_GAA_FLAG_SKIP_ANYCAST = 0x2
+_GAA_FLAG_SKIP_MULTICAST = 0x4
+_GAA_FLAG_SKIP_DNS_SERVER = 0x8
+_ERROR_BUFFER_OVERFLOW = 111
+_ERROR_NO_DATA = 232
+
+# The buffer size needed by the last query, so that it's usually big enough without a sizing call.
+# Only accessed while holding the interface names lock
+_adapter_addresses_size = 16 * 1024
+
+
+def _get_adapter_names():
+    global _adapter_addresses_size
+
+    iphlpapi = ctypes.windll.iphlpapi
+
+    # Only the names are needed, so the address lists are skipped entirely
+    flags = _GAA_FLAG_SKIP_UNICAST | _GAA_FLAG_SKIP_ANYCAST | _GAA_FLAG_SKIP_MULTICAST | _GAA_FLAG_SKIP_DNS_SERVER
+    size = ctypes.c_ulong(_adapter_addresses_size)
+    while True:
+        buffer = ctypes.create_string_buffer(size.value)
+        result = iphlpapi.GetAdaptersAddresses(_AF_UNSPEC, flags, None, buffer, ctypes.byref(size))
+        if result != _ERROR_BUFFER_OVERFLOW:
+            break
+    _adapter_addresses_size = max(_adapter_addresses_size, size.value)
+    if result == _ERROR_NO_DATA:
+        return {}
+    if result != 0:
+        raise OSError(result, 'Failed to get adapter addresses')
+
+    # Keyed by the adapter GUID, which is the interface ID used by netifaces. Unlike the MAC address, it's unique,
+    # as virtual switches, bridges and VPN adapters may share the MAC address of the physical adapter
+    names = {}
+    adapter = ctypes.cast(buffer, ctypes.POINTER(_IPAdapterAddresses))
+    while adapter:
+        contents = adapter.contents
+        names[contents.AdapterName.decode('ascii').upper()] = contents.FriendlyName
+        adapter = contents.Next
+    return names
+
+
+_interface_names = {}
+_interface_names_expiry = 0.0
+_interface_names_lock = threading.Lock()
+_interface_names_ttl = 5.0
+
+
+def _get_interface_name(interface_id):
+    global _interface_names, _interface_names_expiry
+
+    # Interface names by ID are cached for a short while, and refreshed early if an interface is missing
+    interface_id = interface_id.upper()
+    with _interface_names_lock:
+        now = time.monotonic()
+        if now < _interface_names_expiry and interface_id in _interface_names:
+            return _interface_names[interface_id]
+
+        _interface_names = _get_adapter_names()
+        _interface_names_expiry = now + _interface_names_ttl
+        return _interface_names.get(interface_id)
+
+
+_interface_stats = None
+_interface_stats_expiry = 0.0
+_interface_stats_lock = threading.Lock()
+_interface_stats_ttl = 1.0
+
+
+def _get_interface_stats():
+    global _interface_stats, _interface_stats_expiry
+
+    with _interface_stats_lock:
+        now = time.monotonic()
+        if _interface_stats is None or now >= _interface_stats_expiry:
+            _interface_stats = psutil.net_if_stats()
+            _interface_stats_expiry = now + _interface_stats_ttl
+        return _interface_stats
+
 
 class Diagnostics:
 
@@ -44,62 +196,98 @@ def __init__(
         self._cb_on_interruption_end = cb_on_interruption_end
         self._cb_on_interface_update = cb_on_interface_update
         self._cb_on_interface_stats_update = cb_on_interface_stats_update
-        self._cb_on_icmp_gateway_test_start = cb_on_icmp_gateway_test_start
-        self._cb_on_icmp_gateway_test_update = cb_on_icmp_gateway_test_update
-        self._cb_on_icmp_external_test_start = cb_on_icmp_external_test_start
-        self._cb_on_icmp_external_test_update = cb_on_icmp_external_test_update
-        self._cb_on_icmp_cs2_test_start = cb_on_icmp_cs2_test_start
-        self._cb_on_icmp_cs2_test_update = cb_on_icmp_cs2_test_update
-
-        self._diagnostics_dir = get_diagnostics_dir()
+
+        self._diagnostics_dir = Path(get_diagnostics_dir())
+
+        # Setting up the firewall rules is slow, so it's started in the background and only waited for on start
+        self._firewall_rules_future = _executor.submit(_ensure_firewall_rules)
+        self._history_cache = None
+        self._history_cache_mtime = None
         self._stop_diagnostics_logging = None
 
         self._running = False
+        self._stop_event = threading.Event()
 
         self._active_interruption = False
         self._total_interruptions = 0
-        self._internet_connectivity = True
+        self._internet_connectivity = threading.Event()
+        self._internet_connectivity.set()
+
+        # Changes are made from other threads and handled by the watchdog in order, repeated changes of the same
+        # kind are coalesced into the latest one
+        self._changes = {}
+        self._changes_lock = threading.Lock()
+        # Probes whose test failed, restarted by the watchdog so that it doesn't race with changes of their address
+        self._icmp_test_restarts = collections.deque()
 
         self._watchdog_thread = None
         self._watchdog_interval = 1.0
         self._watchdog_interruption_tests_interval = 1.0
+        self._watchdog_interruption_tests_max_interval = 30.0
+        self._scheduler = None
+        self._monitoring_started = False
+        self._interruption_tests_future = None
 
         self._interface = None
         self._interface_stats = None
-        self._interface_changed = False
-        self._interface_update_thread = None
-        self._interface_update_running = False
+        self._interface_update_event = None
         self._interface_update_interval = 1.0
+        self._interface_query_time = None
+        self._interface_cache_duration = 5.0
+        self._interface_change_listener = None
+        self._interface_topology_changed = threading.Event()
+
+        self._icmp_scheduler = ICMPScheduler()
+
+        self._icmp_gateway_probe = ICMPProbe(
+            'gateway',
+            'Gateway',
+            cb_on_icmp_gateway_test_start,
+            cb_on_icmp_gateway_test_update
+        )
+        self._icmp_external_probe = ICMPProbe(
+            'external',
+            'External',
+            cb_on_icmp_external_test_start,
+            cb_on_icmp_external_test_update,
+            rtt_precision=3,
+            connectivity=True
+        )
+        self._icmp_cs2_probe = ICMPProbe(
+            'CS2',
+            'CS2',
+            cb_on_icmp_cs2_test_start,
+            cb_on_icmp_cs2_test_update
+        )
+        self._icmp_probes = (self._icmp_gateway_probe, self._icmp_external_probe, self._icmp_cs2_probe)
 
-        self._icmp_gateway_test = None
-        self._icmp_gateway_test_thread = None
-        self._icmp_gateway_test_seq_loss = 0
-
-        self._icmp_external_test = None
         self._icmp_external_test_server = external_test_server
-        self._icmp_external_test_server_changed = False
-        self._icmp_external_test_thread = None
-        self._icmp_external_test_seq_loss = 0
-
-        self._icmp_cs2_test = None
         self._icmp_cs2_test_server = None
-        self._icmp_cs2_test_server_changed = False
-        self._icmp_cs2_test_thread = None
 
         self._icmp_late_time = 0.5
         self._icmp_max_seq_loss = 1
         self._icmp_interval = 1.0
         self._icmp_timeout = 2.0
+        self._icmp_update_min_interval = 0.05
 
         self._traceroute = None
-        self._traceroute_thread = None
+        self._traceroute_future = None
+        self._traceroute_wait_timeout = 60.0
+        # A traceroute requested while another one is running is started once it finishes
+        self._traceroute_running = False
+        self._pending_traceroute = None
+        self._traceroute_lock = threading.Lock()
 
         self._speed_test = None
-        self._speed_test_thread = None
+        self._speed_test_future = None
         self._speed_test_min_duration = 10.0
 
         self._event_log_listener = None
-        self._event_log_listener_thread = None
+
+        self._callbacks = queue.SimpleQueue()
+        self._callbacks_lock = threading.Lock()
+        self._coalesced_callbacks = {}
+        self._callbacks_thread = None
 
     @property
     def running(self):
@@ -114,28 +302,33 @@ def start(self):
             log.debug('Attempted to start diagnostics while thread is alive')
             return
         self._running = True
+        self._stop_event.clear()
 
-        timestamp = datetime.datetime.now().astimezone().strftime('%Y-%m-%dT%H-%M-%S%z')
-        current_diagnostics_dir = self._diagnostics_dir / timestamp
-        i = 2
-        try:
-            while current_diagnostics_dir.exists():
-                current_diagnostics_dir = self._diagnostics_dir / f'{timestamp}.{i}'
-                i += 1
-        except:
-            self._running = False
-            raise
-
+        # A failed setup from the background is retried on the next start
+        future, self._firewall_rules_future = self._firewall_rules_future, None
         try:
-            create_firewall_rules()
+            if future is not None:
+                future.result()
+            else:
+                _ensure_firewall_rules()
         except:
             self._running = False
             raise
 
-        log.debug(f"Creating current diagnostics directory '{current_diagnostics_dir}'")
+        # Creating the directory fails if it already exists, so a suffix is only searched for on collisions
+        timestamp = datetime.datetime.now().astimezone().strftime('%Y-%m-%dT%H-%M-%S%z')
+        current_diagnostics_dir = self._diagnostics_dir / timestamp
+        i = 2
         try:
-            current_diagnostics_dir.mkdir(parents=True, exist_ok=True)
+            while True:
+                try:
+                    current_diagnostics_dir.mkdir(parents=True)
+                    break
+                except FileExistsError:
+                    current_diagnostics_dir = self._diagnostics_dir / f'{timestamp}.{i}'
+                    i += 1
         except OSError as e:
+            self._running = False
             raise OSError(
                 e.errno,
                 'Failed to create current diagnostics directory',
@@ -144,6 +337,9 @@ def start(self):
         except:
             self._running = False
             raise
+        log.debug(f"Created current diagnostics directory '{current_diagnostics_dir}'")
+
+        self._add_to_history_cache(current_diagnostics_dir)
 
         try:
             log.info('Starting diagnostics logging')
@@ -169,45 +365,85 @@ def stop(self, blocking=True):
         log.debug(f'Diagnostics stop, blocking: {blocking}')
 
         self._running = False
+        self._stop_event.set()
         if blocking and self._watchdog_thread:
             self._watchdog_thread.join()
 
     def set_icmp_external_test_server(self, server):
         if server is None:
             raise ValueError('External server cannot be None')
-        self._icmp_external_test_server = server
-        self._icmp_external_test_server_changed = True
+        with self._changes_lock:
+            self._icmp_external_test_server = server
+            self._add_change('external_server', server)
 
     def set_icmp_cs2_test_server(self, server):
-        if self._icmp_cs2_test_server == server:
-            return
-        self._icmp_cs2_test_server = server
-        self._icmp_cs2_test_server_changed = True
+        with self._changes_lock:
+            if self._icmp_cs2_test_server == server:
+                return
+            self._icmp_cs2_test_server = server
+            self._add_change('cs2_server', server)
 
     def get_diagnostics_history(self):
-        return sorted(
-            ((path.name, path) for path in self._diagnostics_dir.iterdir()),
-            key=lambda item: item[0],
-            reverse=True
-        )
+        return [(name, self._diagnostics_dir / name) for name in reversed(self._get_history_cache())]
 
     def get_last_diagnostics(self):
-        history = self.get_diagnostics_history()
-        return history[0] if history else None
+        history = self._get_history_cache()
+        if not history:
+            return None
+        return history[-1], self._diagnostics_dir / history[-1]
+
+    def _get_history_cache(self):
+        # The history is kept sorted in ascending order and only rescanned when the directory has been modified
+        mtime = self._diagnostics_dir.stat().st_mtime_ns
+        if self._history_cache is None or mtime != self._history_cache_mtime:
+            with os.scandir(self._diagnostics_dir) as entries:
+                self._history_cache = sorted(entry.name for entry in entries)
+            self._history_cache_mtime = mtime
+        return self._history_cache
+
+    def _add_to_history_cache(self, path):
+        if self._history_cache is None:
+            return
+
+        try:
+            mtime = self._diagnostics_dir.stat().st_mtime_ns
+        except OSError:
+            self._history_cache = None
+            return
+
+        bisect.insort(self._history_cache, path.name)
+        self._history_cache_mtime = mtime
 
     def _watchdog_run(self):
         log.debug('Watchdog start')
 
+        self._start_callbacks_dispatch()
+
+        # All periodic work of the watchdog is scheduled as events on a single timer loop,
+        # which returns once every event has finished without scheduling itself again
+        self._scheduler = sched.scheduler(time.monotonic, self._watchdog_wait)
+
         self._start_event_log_listener()
+        self._start_interface_change_listener()
         self._start_interface_update()
 
-        # Wait for the interface update to finish or exit early if requested
-        while self._interface_update_thread and self._interface_update_thread.is_alive():
-            if not self._running:
-                log.debug('Stopping watchdog during initial interface update')
-                self._stop_interface_update()
-                return
-            self._interface_update_thread.join(self._watchdog_interval)
+        self._scheduler.run()
+
+        log.debug('Watchdog stop')
+
+    def _watchdog_wait(self, timeout):
+        # Return as soon as the diagnostics are stopped and drop all pending events, so that the timer loop exits
+        if self._stop_event.wait(timeout):
+            for event in self._scheduler.queue:
+                try:
+                    self._scheduler.cancel(event)
+                except ValueError:
+                    pass
+
+    def _start_monitoring(self):
+        if not self._running:
+            log.debug('Stopping watchdog during initial interface update')
+            return
 
         # Log current statistics
         self._log_netsat_statistics()
@@ -219,123 +455,177 @@ def _watchdog_run(self):
         # Active interface has been found and initial traceroute has started
         # Begin ICMP tests and connection monitoring
 
-        self._start_icmp_gateway_test(self._interface.gateway_ipv4_address)
+        self._icmp_scheduler.start()
+
+        self._start_icmp_test(self._icmp_gateway_probe, self._interface.gateway_ipv4_address)
 
         if not self._icmp_external_test_server:
             log.error('No ICMP external test server specified')
-            log.debug('Watchdog stop')
+            self._running = False
+            self._stop_event.set()
             return
 
-        self._start_icmp_external_test(self._icmp_external_test_server)
+        self._start_icmp_test(self._icmp_external_probe, self._icmp_external_test_server)
 
         cs2_server = self._icmp_cs2_test_server
         if cs2_server:
-            self._start_icmp_cs2_test(cs2_server)
+            self._start_icmp_test(self._icmp_cs2_probe, cs2_server)
         else:
             log.info('Not starting ICMP CS2 test because server is not specified')
 
-        while self._running:
-            # Check for connection to external server and begin advanced diagnostics on interruption
+        self._scheduler.enter(self._watchdog_interval, 0, self._watchdog_tick)
+
+    def _watchdog_tick(self):
+        if not self._running:
+            return
 
-            if not self._internet_connectivity:
-                if not self._active_interruption:
-                    log.info('Internet connection lost')
+        # Check for connection to external server and begin advanced diagnostics on interruption
 
-                    self._active_interruption = True
-                    self._total_interruptions += 1
-                    self._on_interruption_start(self._total_interruptions)
+        if not self._internet_connectivity.is_set():
+            if not self._active_interruption:
+                log.info('Internet connection lost')
 
-            elif self._active_interruption:
-                log.info('Internet connection established')
+                self._active_interruption = True
+                self._total_interruptions += 1
+                self._on_interruption_start(self._total_interruptions)
 
-                self._active_interruption = False
-                self._on_interruption_end()
+        elif self._active_interruption:
+            log.info('Internet connection established')
 
-            # Check for changes and restart components accordingly
+            self._active_interruption = False
+            self._on_interruption_end()
 
-            if self._interface_changed:
-                gateway_address = self._interface.gateway_ipv4_address
+        # Search for the active interface again if the network interfaces have changed since the last search
 
-                log.info('Active interface was updated')
-                self._interface_changed = False
+        if self._interface_topology_changed.is_set() and self._interface_update_event is None:
+            self._start_interface_update()
 
-                self._stop_icmp_gateway_test()
-                self._start_icmp_gateway_test(gateway_address)
+        # Check for changes and restart components accordingly, unless the interruption tests are still running,
+        # in which case the changes are handled once they finish
 
-                self._wait_traceroute()
-                self._run_traceroute(self._icmp_external_test_server)
+        if not self._interruption_tests_future or self._interruption_tests_future.done():
+            self._handle_changes()
 
-            if self._icmp_external_test_server_changed:
-                log.info(f'ICMP test server was set to: {self._icmp_external_test_server}')
-                self._icmp_external_test_server_changed = False
+        # Failed tests are restarted regardless, as they are needed the most during an interruption
+        self._handle_icmp_test_restarts()
 
-                self._stop_icmp_external_test()
-                self._start_icmp_external_test(self._icmp_external_test_server)
+        self._scheduler.enter(self._watchdog_interval, 0, self._watchdog_tick)
 
-                self._wait_traceroute()
-                self._run_traceroute(self._icmp_external_test_server)
+    def _add_change(self, change, value):
+        self._changes.pop(change, None)
+        self._changes[change] = value
 
-            if self._icmp_cs2_test_server_changed:
-                cs2_server = self._icmp_cs2_test_server
+    def _handle_changes(self):
+        # Nothing has changed on most ticks, which is checked without taking the lock
+        if not self._changes:
+            return
 
-                log.info(f'ICMP CS2 test server was set to: {cs2_server}')
-                self._icmp_cs2_test_server_changed = False
+        # Never block the watchdog on a setter, the changes are picked up on the next tick instead
+        if not self._changes_lock.acquire(blocking=False):
+            return
+        try:
+            changes = self._changes
+            self._changes = {}
+        finally:
+            self._changes_lock.release()
+
+        for change, value in changes.items():
+            if change == 'interface':
+                self._on_interface_change(value)
+            elif change == 'external_server':
+                self._on_icmp_external_test_server_change(value)
+            elif change == 'cs2_server':
+                self._on_icmp_cs2_test_server_change(value)
+
+    def _handle_icmp_test_restarts(self):
+        while self._icmp_test_restarts:
+            probe = self._icmp_test_restarts.popleft()
+
+            # The test may have been stopped or restarted with a new address since it failed
+            if probe.address is None or (probe.test and probe.test.running):
+                continue
+            self._start_icmp_test(probe, probe.address)
 
-                self._stop_icmp_cs2_test()
+    def _on_interface_change(self, interface):
+        gateway_address = interface.gateway_ipv4_address
 
-                if cs2_server is not None:
-                    self._start_icmp_cs2_test(cs2_server)
+        log.info('Active interface was updated')
 
-                    self._wait_traceroute()
-                    self._run_traceroute(cs2_server)
+        self._stop_icmp_test(self._icmp_gateway_probe)
+        self._start_icmp_test(self._icmp_gateway_probe, gateway_address)
 
-            time.sleep(self._watchdog_interval)
+        self._wait_traceroute(self._traceroute_wait_timeout)
+        self._run_traceroute(self._icmp_external_test_server)
 
-        log.debug('Watchdog stop')
+    def _on_icmp_external_test_server_change(self, external_server):
+        log.info(f'ICMP test server was set to: {external_server}')
+
+        self._stop_icmp_test(self._icmp_external_probe)
+        self._start_icmp_test(self._icmp_external_probe, external_server)
+
+        self._wait_traceroute(self._traceroute_wait_timeout)
+        self._run_traceroute(external_server)
+
+    def _on_icmp_cs2_test_server_change(self, cs2_server):
+        log.info(f'ICMP CS2 test server was set to: {cs2_server}')
+
+        self._stop_icmp_test(self._icmp_cs2_probe)
+
+        if cs2_server is not None:
+            self._start_icmp_test(self._icmp_cs2_probe, cs2_server)
+
+            self._wait_traceroute(self._traceroute_wait_timeout)
+            self._run_traceroute(cs2_server)
 
     def _clean_up(self):
         log.debug('Clean up')
 
         self._running = False
+        self._stop_event.set()
+
+        # Components that stop immediately are stopped first, so that they don't wait for the tests to finish.
+        # The interruption tests, traceroute and speed test run concurrently, so waiting for them takes only as
+        # long as the slowest one
+        for probe in self._icmp_probes:
+            self._stop_icmp_test(probe)
+        self._icmp_scheduler.stop()
+        self._stop_interface_update()
+        self._stop_event_log_listener()
+        self._stop_interface_change_listener()
 
+        if self._interruption_tests_future:
+            concurrent.futures.wait((self._interruption_tests_future,))
         self._wait_traceroute()
         self._wait_speed_test()
-        self._stop_icmp_gateway_test()
-        self._stop_icmp_external_test()
-        self._stop_icmp_cs2_test()
-        self._stop_interface_update()
-        self._stop_event_log_listener()
+        self._stop_callbacks_dispatch()
 
         self._active_interruption = False
         self._total_interruptions = 0
 
+        with self._changes_lock:
+            self._changes = {}
+        self._icmp_test_restarts.clear()
+
         self._watchdog_thread = None
+        self._scheduler = None
+        self._monitoring_started = False
+        self._interruption_tests_future = None
 
         self._interface = None
         self._interface_stats = None
-        self._interface_changed = False
-        self._interface_update_thread = None
-
-        self._icmp_gateway_test = None
-        self._icmp_gateway_test_thread = None
-
-        self._icmp_external_test = None
-        self._icmp_external_test_thread = None
+        self._interface_query_time = None
 
-        self._icmp_cs2_test = None
-        self._icmp_cs2_test_thread = None
+        for probe in self._icmp_probes:
+            probe.test = None
+            probe.seq_loss = 0
+            probe.last_update_time = 0.0
 
         self._traceroute = None
-        self._traceroute_thread = None
+        self._traceroute_future = None
+        self._pending_traceroute = None
 
         self._speed_test = None
-        self._speed_test_thread = None
-
-        try:
-            remove_firewall_rules()
-        except OSError as e:
-            log.debug('Error removing firewall rules', exc_info=True)
-            log.error(f'Failed to remove firewall rules: {e}')
+        self._speed_test_future = None
 
         log.info('Stopping diagnostics logging')
         if self._stop_diagnostics_logging:
@@ -347,6 +637,61 @@ def _clean_up(self):
 
         log.info('Diagnostics stopped')
 
+    def _start_callbacks_dispatch(self):
+        log.debug('Start callbacks dispatch')
+
+        if self._callbacks_thread and self._callbacks_thread.is_alive():
+            log.debug('Attempted to start callbacks dispatch while thread is alive')
+            return
+
+        self._callbacks_thread = threading.Thread(
+            target=self._callbacks_dispatch_run,
+            name='callbacks-dispatch',
+            daemon=True
+        )
+        self._callbacks_thread.start()
+
+    def _stop_callbacks_dispatch(self):
+        log.debug('Stop callbacks dispatch')
+
+        if self._callbacks_thread:
+            # Callbacks queued before stopping are still dispatched
+            self._callbacks.put((None, None))
+            self._callbacks_thread.join()
+            self._callbacks_thread = None
+
+    def _dispatch_callback(self, callback, *args, coalesce=False):
+        # Callbacks are invoked on a separate thread, so that slow callbacks don't delay the tests
+        if callback is None:
+            return
+
+        if not coalesce:
+            self._callbacks.put((callback, args))
+            return
+
+        # Only the latest arguments of a callback that is already queued are kept
+        with self._callbacks_lock:
+            queued = callback in self._coalesced_callbacks
+            self._coalesced_callbacks[callback] = args
+        if not queued:
+            self._callbacks.put((callback, None))
+
+    def _callbacks_dispatch_run(self):
+        while True:
+            callback, args = self._callbacks.get()
+            if callback is None:
+                break
+
+            if args is None:
+                with self._callbacks_lock:
+                    args = self._coalesced_callbacks.pop(callback)
+
+            try:
+                callback(*args)
+            except Exception as e:
+                log.debug('Error invoking callback', exc_info=True)
+                log.error(f'Error invoking callback: {e}')
+
     def _log_netsat_statistics(self):
         log.debug('Log netstat statistics')
 
@@ -360,16 +705,29 @@ def _log_netsat_statistics(self):
     def _on_interruption_start(self, total_interruptions):
         log.debug('On interruption start')
 
-        if self._cb_on_interruption_start is not None:
-            self._cb_on_interruption_start(total_interruptions)
-
-        # Before starting more diagnostics, wait for all currently running diagnostics
-        self._wait_traceroute()
-        self._wait_speed_test()
+        self._dispatch_callback(self._cb_on_interruption_start, total_interruptions)
 
         # Start searching for the active interface in case it changed
         self._start_interface_update()
 
+        if self._interruption_tests_future and not self._interruption_tests_future.done():
+            log.debug('Attempted to start interruption tests while previous tests are running')
+            return
+
+        # Run the tests outside of the watchdog, so that the interface update keeps running meanwhile
+        self._interruption_tests_future = _executor.submit(self._interruption_tests_run)
+        self._interruption_tests_future.add_done_callback(self._on_interruption_tests_done)
+
+    def _on_interruption_tests_done(self, future):
+        exception = future.exception()
+        if exception is not None:
+            log.error('Interruption tests error', exc_info=exception)
+
+    def _interruption_tests_run(self):
+        # Before starting more diagnostics, wait for all currently running diagnostics
+        self._wait_traceroute(self._traceroute_wait_timeout)
+        self._wait_speed_test()
+
         # Log current statistics
         self._log_netsat_statistics()
 
@@ -382,8 +740,12 @@ def _on_interruption_start(self, total_interruptions):
         traceroute_succeeded = False
         short_speed_test_succeeded = False
         long_speed_test_succeeded = False
+        # Number of consecutive retries in which no test succeeded, used to back off exponentially
+        failed_attempts = 0
 
         while self._running and self._active_interruption:
+            succeeded = (traceroute_succeeded, short_speed_test_succeeded, long_speed_test_succeeded)
+
             # Re-run traceroute if it was unsuccessful last time
             if not traceroute_succeeded:
                 log.info('Starting traceroute')
@@ -419,7 +781,7 @@ def _on_interruption_start(self, total_interruptions):
 
             # Check if the traceroute started before the speed test is successful
             if not traceroute_succeeded:
-                self._wait_traceroute()
+                self._wait_traceroute(self._traceroute_wait_timeout)
                 if self._traceroute.hops is not None:
                     traceroute_succeeded = True
 
@@ -431,332 +793,321 @@ def _on_interruption_start(self, total_interruptions):
                 # All tests have completed successfully
                 log.info('All tests on interruption finished')
                 break
-            else:
-                # Wait before retrying tests
-                time.sleep(self._watchdog_interruption_tests_interval)
+
+            if succeeded != (traceroute_succeeded, short_speed_test_succeeded, long_speed_test_succeeded):
+                failed_attempts = 0
+
+            # Wait before retrying tests
+            interval = min(
+                self._watchdog_interruption_tests_interval * 2 ** failed_attempts,
+                self._watchdog_interruption_tests_max_interval
+            )
+            if interval < self._watchdog_interruption_tests_max_interval:
+                failed_attempts += 1
+            log.debug(f'Retrying interruption tests in {interval} seconds')
+            self._stop_event.wait(interval)
 
     def _on_interruption_end(self):
         log.debug('On interruption end')
 
-        if self._cb_on_interruption_end is not None:
-            self._cb_on_interruption_end()
+        self._dispatch_callback(self._cb_on_interruption_end)
 
     def _start_interface_update(self):
         log.debug('Start interface update')
 
-        if self._interface_update_thread and self._interface_update_thread.is_alive():
-            log.debug('Attempted to start interface update while thread is alive')
+        if self._interface_update_event is not None:
+            log.debug('Attempted to start interface update while it is scheduled')
             return
-        self._interface_update_running = True
 
-        self._interface_update_thread = threading.Thread(
-            target=self._interface_update_run,
-            name='interface-update',
-            daemon=True
-        )
-        self._interface_update_thread.start()
+        log.info('Interface update started')
+        self._interface_update_event = self._scheduler.enter(0, 0, self._interface_update_tick)
 
     def _stop_interface_update(self):
         log.debug('Stop interface update')
 
-        self._interface_update_running = False
-        if self._interface_update_thread:
-            self._interface_update_thread.join()
+        if self._interface_update_event is None:
+            return
 
-    def _interface_update_run(self):
-        log.info('Interface update started')
+        try:
+            self._scheduler.cancel(self._interface_update_event)
+        except ValueError:
+            pass
+        self._interface_update_event = None
 
-        while self._interface_update_running:
-            try:
-                interface = NetworkInterface.from_default_gateway()
-            except Exception:
-                log.debug('Error getting active interface', exc_info=True)
+        log.info('Interface update stopped')
 
-                if not self._interface:
-                    log.error('Failed to get active interface from default gateway, retrying')
-                    time.sleep(self._interface_update_interval)
-                    continue
+    def _interface_update_tick(self):
+        self._interface_update_event = None
 
-                log.error('Failed to get active interface from default gateway')
+        if not self._running:
+            log.info('Interface update stopped')
+            return
 
-            try:
-                stats = interface.get_stats()
-            except Exception:
-                log.debug('Error getting active interface statistics', exc_info=True)
-                log.error('Failed to get active interface statistics, retrying')
-                time.sleep(self._interface_update_interval)
-                continue
+        try:
+            interface = self._get_active_interface()
+        except Exception:
+            log.debug('Error getting active interface', exc_info=True)
 
             if not self._interface:
-                # First iteration where the active interface is found
+                log.error('Failed to get active interface from default gateway, retrying')
+            else:
+                log.error('Failed to get active interface from default gateway')
 
-                log.debug('Initial interface update')
+            self._schedule_interface_update()
+            return
 
-                self._interface = interface
-                self._interface_stats = stats
-                self._on_interface_update(interface)
-                self._on_interface_stats_update(stats)
+        try:
+            stats = interface.get_stats()
+        except Exception:
+            log.debug('Error getting active interface statistics', exc_info=True)
+            log.error('Failed to get active interface statistics, retrying')
+            self._schedule_interface_update()
+            return
+        up = stats['up']
 
-            elif (
-                self._interface.id != interface.id
-                or self._interface.name != interface.name
-                or self._interface.mac_address != interface.mac_address
-                or self._interface.ipv4_address != interface.ipv4_address
-                or self._interface.gateway_ipv4_address != interface.gateway_ipv4_address
-            ):
-                # Subsequent iterations where the active interface has changed
+        if not self._interface:
+            # First iteration where the active interface is found
 
-                log.debug(f"Active interface changed, ID: {interface.id}, name: {interface.name}, up: {stats['up']}")
+            log.debug('Initial interface update')
 
-                self._interface = interface
-                self._interface_stats = stats
-                self._interface_changed = True
-                self._on_interface_update(interface)
-                self._on_interface_stats_update(stats)
+            self._interface = interface
+            self._interface_stats = stats
+            self._on_interface_update(interface)
+            self._on_interface_stats_update(stats)
 
-            elif self._interface_stats != stats:
-                # Subsequent iterations where the active interface stats have changed
+        elif self._interface.identity != interface.identity:
+            # Subsequent iterations where the active interface has changed
 
-                log.debug(f"Active interface stats changed, up: {stats['up']}")
+            log.debug(
+                'Active interface changed, ID: %s, name: %s, up: %s',
+                interface.id,
+                interface.name,
+                up
+            )
 
-                self._interface_stats = stats
-                self._on_interface_stats_update(stats)
+            self._interface = interface
+            self._interface_stats = stats
+            with self._changes_lock:
+                self._add_change('interface', interface)
+            self._on_interface_update(interface)
+            self._on_interface_stats_update(stats)
 
-            if self._interface_stats['up']:
-                # The interface found is up and searching is no longer necessary
+        elif self._interface_stats != stats:
+            # Subsequent iterations where the active interface stats have changed
 
-                log.debug('Interface is up, stopping update')
+            log.debug('Active interface stats changed, up: %s', up)
 
-                self._interface_update_running = False
-                break
+            self._interface_stats = stats
+            self._on_interface_stats_update(stats)
 
+        if not up:
             # Wait for the specified interval before attempting another search
-            time.sleep(self._interface_update_interval)
-
-        log.info('Interface update stopped')
-
-    def _on_interface_update(self, interface):
-        name = interface.name
-        speed = self._interface_stats['speed']
-        duplex = self._interface_stats['duplex_str']
-        log.info(f'Active interface found: {name}, {speed} Mbps ({duplex} duplex)')
-
-        if self._cb_on_interface_update is not None:
-            self._cb_on_interface_update(interface)
-
-    def _on_interface_stats_update(self, interface_stats):
-        if self._cb_on_interface_stats_update is not None:
-            self._cb_on_interface_stats_update(interface_stats)
-
-    def _start_icmp_gateway_test(self, gateway_address):
-        log.debug('Start ICMP gateway test')
-
-        if self._icmp_gateway_test and self._icmp_gateway_test.running:
-            log.debug('Attempted to start ICMP gateway test while previous test is running')
+            self._schedule_interface_update()
             return
 
-        if self._cb_on_icmp_gateway_test_start is not None:
-            self._cb_on_icmp_gateway_test_start(gateway_address)
+        # The interface found is up and searching is no longer necessary
 
-        self._icmp_gateway_test = ICMPTest(
-            gateway_address,
-            self._icmp_interval,
-            self._icmp_timeout,
-            self._on_icmp_gateway_test_update,
-            self._on_icmp_gateway_test_error
-        )
-        self._icmp_gateway_test_thread = threading.Thread(
-            target=self._icmp_gateway_test.run,
-            name='icmp-gateway-test',
-            daemon=True
+        log.debug('Interface is up, stopping update')
+        log.info('Interface update stopped')
+
+        if not self._monitoring_started:
+            self._monitoring_started = True
+            self._scheduler.enter(0, 0, self._start_monitoring)
+
+    def _get_active_interface(self):
+        # Querying the default gateway is cheap compared to enumerating all adapters,
+        # so the full query is skipped while the default gateway and its interface stay the same
+        # and the network interfaces have not changed, or for a limited time without change notifications
+        default_gateway = NetworkInterface.get_default_gateway()
+        now = time.monotonic()
+
+        if (
+            self._interface
+            and (self._interface.gateway_ipv4_address, self._interface.id) == default_gateway
+            and not self._interface_topology_changed.is_set()
+            and (
+                self._interface_change_listener is not None
+                or now - self._interface_query_time < self._interface_cache_duration
+            )
+        ):
+            return self._interface
+
+        self._interface_topology_changed.clear()
+        interface = NetworkInterface.from_default_gateway(default_gateway)
+        self._interface_query_time = now
+        return interface
+
+    def _schedule_interface_update(self):
+        self._interface_update_event = self._scheduler.enter(
+            self._interface_update_interval,
+            0,
+            self._interface_update_tick
         )
-        self._icmp_gateway_test_thread.start()
 
-        log.info(f'ICMP gateway test started to: {gateway_address}')
-        log_icmp.info(f'ICMP gateway test started to: {gateway_address}')
+    def _start_interface_change_listener(self):
+        log.debug('Start interface change listener')
 
-    def _stop_icmp_gateway_test(self):
-        log.debug('Stop ICMP gateway test')
+        if self._interface_change_listener:
+            log.debug('Attempted to start interface change listener while registered')
+            return
 
-        if self._icmp_gateway_test:
-            self._icmp_gateway_test.stop()
-            self._icmp_gateway_test_thread.join()
+        listener = InterfaceChangeListener(on_change=self._interface_topology_changed.set)
+        try:
+            listener.listen()
+        except Exception as e:
+            log.debug('Error starting interface change listener', exc_info=True)
+            log.warning(f'Failed to start interface change listener, polling interfaces instead: {e}')
+            return
 
-            log_icmp.info(f'Gateway RTT data:\n{self._icmp_gateway_test.rtt_data}')
+        self._interface_change_listener = listener
 
-    def _on_icmp_gateway_test_update(self, rtt_data, lost):
-        if lost:
-            log_icmp.info(f'Gateway ({rtt_data.host}): Timeout')
-        elif rtt_data.last >= self._icmp_late_time:
-            log_icmp.info(f'Gateway ({rtt_data.host}): {rtt_data.last} (late)')
-        else:
-            log_icmp.info(f'Gateway ({rtt_data.host}): {rtt_data.last}')
+    def _stop_interface_change_listener(self):
+        log.debug('Stop interface change listener')
 
-        if self._cb_on_icmp_gateway_test_update is not None:
-            self._cb_on_icmp_gateway_test_update(rtt_data)
+        if self._interface_change_listener:
+            self._interface_change_listener.stop()
+            self._interface_change_listener = None
+        self._interface_topology_changed.clear()
 
-    def _on_icmp_gateway_test_error(self, exception):
-        log.debug('ICMP gateway test error', exc_info=True)
-        log.error(f'ICMP gateway test error: {exception}')
-        log_icmp.error('ICMP gateway test error', exc_info=True)
-        log_icmp.info(f'Gateway RTT data (on error):\n{self._icmp_gateway_test.rtt_data}')
+    def _on_interface_update(self, interface):
+        name = interface.name
+        stats = self._interface_stats
+        speed = stats['speed']
+        duplex = stats['duplex_str']
+        log.info(f'Active interface found: {name}, {speed} Mbps ({duplex} duplex)')
 
-        time.sleep(self._icmp_interval)
+        self._dispatch_callback(self._cb_on_interface_update, interface)
 
-        gateway_address = self._interface.gateway_ipv4_address
-        if gateway_address is not None:
-            self._start_icmp_gateway_test(gateway_address)
+    def _on_interface_stats_update(self, interface_stats):
+        self._dispatch_callback(self._cb_on_interface_stats_update, interface_stats, coalesce=True)
 
-    def _start_icmp_external_test(self, external_server_address):
-        log.debug('Start ICMP external test')
+    def _start_icmp_test(self, probe, address, delay=0.0):
+        log.debug(f'Start ICMP {probe.name} test')
 
-        if self._icmp_external_test and self._icmp_external_test.running:
-            log.debug('Attempted to start ICMP external test while previous test is running')
+        if probe.test and probe.test.running:
+            log.debug(f'Attempted to start ICMP {probe.name} test while previous test is running')
             return
 
-        if self._cb_on_icmp_external_test_start is not None:
-            self._cb_on_icmp_external_test_start(external_server_address)
+        self._dispatch_callback(probe.cb_on_start, address)
 
-        self._icmp_external_test = ICMPTest(
-            external_server_address,
+        probe.address = address
+        probe.test = ICMPTest(
+            address,
             self._icmp_interval,
             self._icmp_timeout,
-            self._on_icmp_external_test_update,
-            self._on_icmp_external_test_error
+            functools.partial(self._on_icmp_test_update, probe),
+            functools.partial(self._on_icmp_test_error, probe),
+            self._icmp_scheduler
         )
-        self._icmp_external_test_thread = threading.Thread(
-            target=self._icmp_external_test.run,
-            name='icmp-test',
-            daemon=True
-        )
-        self._icmp_external_test_thread.start()
+        probe.test.run(delay)
 
-        log.info(f'ICMP external test started to: {external_server_address}')
-        log_icmp.info(f'ICMP external test started to: {external_server_address}')
+        log.info(f'ICMP {probe.name} test started to: {address}')
+        log_icmp.info(f'ICMP {probe.name} test started to: {address}')
 
-    def _stop_icmp_external_test(self):
-        log.debug('Stop ICMP external test')
+    def _stop_icmp_test(self, probe):
+        log.debug(f'Stop ICMP {probe.name} test')
 
-        if self._icmp_external_test:
-            self._icmp_external_test.stop()
-            self._icmp_external_test_thread.join()
+        probe.address = None
+        if probe.test:
+            probe.test.stop()
 
-            log_icmp.info(f'External RTT data:\n{self._icmp_external_test.rtt_data}')
+            log_icmp.info(f'{probe.label} RTT data:\n{probe.test.rtt_data}')
 
-    def _on_icmp_external_test_update(self, rtt_data, lost):
-        if self._cb_on_icmp_external_test_update is not None:
-            self._cb_on_icmp_external_test_update(rtt_data)
+    def _on_icmp_test_update(self, probe, rtt_data, lost):
+        # Updates are passed on at a capped rate, except for losses which are always shown
+        now = time.monotonic()
+        if lost or now - probe.last_update_time >= self._icmp_update_min_interval:
+            probe.last_update_time = now
+            self._dispatch_callback(probe.cb_on_update, rtt_data, coalesce=True)
 
         if lost:
-            log_icmp.info(f'External ({rtt_data.host}): Timeout')
-            self._icmp_external_test_seq_loss += 1
+            log_icmp.info('%s (%s): Timeout', probe.label, rtt_data.host)
+        elif rtt_data.last >= self._icmp_late_time:
+            log_icmp.info(probe.late_rtt_format, probe.label, rtt_data.host, rtt_data.last)
         else:
-            if rtt_data.last >= self._icmp_late_time:
-                log_icmp.info(f'External ({rtt_data.host}): {rtt_data.last:.3f} (late)')
-            else:
-                log_icmp.info(f'External ({rtt_data.host}): {rtt_data.last:.3f}')
-            self._internet_connectivity = True
-            self._icmp_external_test_seq_loss = 0
-
-        if self._icmp_external_test_seq_loss >= self._icmp_max_seq_loss:
-            self._internet_connectivity = False
-
-    def _on_icmp_external_test_error(self, exception):
-        log.debug('ICMP external test error', exc_info=True)
-        log.error(f'ICMP external test error: {exception}')
-        log_icmp.error('ICMP external test error', exc_info=True)
-        log_icmp.info(f'External RTT data (on error):\n{self._icmp_external_test.rtt_data}')
-
-        self._internet_connectivity = False
+            log_icmp.info(probe.rtt_format, probe.label, rtt_data.host, rtt_data.last)
 
-        time.sleep(self._icmp_interval)
-        self._start_icmp_external_test(self._icmp_external_test_server)
-
-    def _start_icmp_cs2_test(self, cs2_server_address):
-        log.debug('Start ICMP CS2 test')
-
-        if self._icmp_cs2_test and self._icmp_cs2_test.running:
-            log.debug('Attempted to start ICMP CS2 test while previous test is running')
+        if not probe.connectivity:
             return
 
-        if self._cb_on_icmp_cs2_test_start is not None:
-            self._cb_on_icmp_cs2_test_start(cs2_server_address)
-
-        self._icmp_cs2_test = ICMPTest(
-            cs2_server_address,
-            self._icmp_interval,
-            self._icmp_timeout,
-            self._on_icmp_cs2_test_update,
-            self._on_icmp_cs2_test_error
-        )
-        self._icmp_cs2_test_thread = threading.Thread(
-            target=self._icmp_cs2_test.run,
-            name='icmp-cs2-test',
-            daemon=True
-        )
-        self._icmp_cs2_test_thread.start()
-
-        log.info(f'ICMP CS2 test started to: {cs2_server_address}')
-        log_icmp.info(f'ICMP CS2 test started to: {cs2_server_address}')
-
-    def _stop_icmp_cs2_test(self):
-        log.debug('Stop ICMP CS2 test')
-
-        if self._icmp_cs2_test:
-            self._icmp_cs2_test.stop()
-            self._icmp_cs2_test_thread.join()
-
-            log_icmp.info(f'CS2 RTT data:\n{self._icmp_cs2_test.rtt_data}')
-
-    def _on_icmp_cs2_test_update(self, rtt_data, lost):
         if lost:
-            log_icmp.info(f'CS2 ({rtt_data.host}): Timeout')
-        elif rtt_data.last >= self._icmp_late_time:
-            log_icmp.info(f'CS2 ({rtt_data.host}): {rtt_data.last} (late)')
+            probe.seq_loss += 1
         else:
-            log_icmp.info(f'CS2 ({rtt_data.host}): {rtt_data.last}')
+            self._internet_connectivity.set()
+            probe.seq_loss = 0
 
-        if self._cb_on_icmp_cs2_test_update is not None:
-            self._cb_on_icmp_cs2_test_update(rtt_data)
+        if probe.seq_loss >= self._icmp_max_seq_loss:
+            self._internet_connectivity.clear()
 
-    def _on_icmp_cs2_test_error(self, exception):
-        log.debug('ICMP CS2 test error', exc_info=True)
-        log.error(f'ICMP CS2 test error: {exception}')
-        log_icmp.error('ICMP CS2 test error', exc_info=True)
-        log_icmp.info(f'CS2 RTT data (on error):\n{self._icmp_cs2_test.rtt_data}')
+    def _on_icmp_test_error(self, probe, exception):
+        log.debug(f'ICMP {probe.name} test error', exc_info=True)
+        log.error(f'ICMP {probe.name} test error: {exception}')
+        log_icmp.error(f'ICMP {probe.name} test error', exc_info=True)
+        log_icmp.info(f'{probe.label} RTT data (on error):\n{probe.test.rtt_data}')
 
-        time.sleep(self._icmp_interval)
+        if probe.connectivity:
+            self._internet_connectivity.clear()
 
-        cs2_server = self._icmp_cs2_test_server
-        if cs2_server is not None:
-            self._start_icmp_cs2_test(cs2_server)
+        # Invoked on the ICMP scheduler thread, the watchdog restarts the test on its next tick with the address
+        # configured by then
+        self._icmp_test_restarts.append(probe)
 
     def _run_traceroute(self, host, *args, **kwargs):
         log.debug('Run traceroute')
 
-        if self._traceroute_thread and self._traceroute_thread.is_alive():
-            log.debug('Attempted to run traceroute while thread is alive')
-            return
+        with self._traceroute_lock:
+            if self._traceroute_running:
+                log.debug(f"Traceroute is still running, queued traceroute to destination '{host}' to run after it")
+                self._pending_traceroute = (host, args, kwargs)
+                return
+            self._start_traceroute(host, args, kwargs)
 
+    def _start_traceroute(self, host, args, kwargs):
+        # Called while holding the traceroute lock
         def wrapper():
-            log.info(f"Traceroute to destination '{host}' started")
-            log_tests.info(f"Traceroute to destination '{host}' started")
-            self._traceroute.run()
+            try:
+                log.info(f"Traceroute to destination '{host}' started")
+                log_tests.info(f"Traceroute to destination '{host}' started")
+                self._traceroute.run()
 
-            if self._traceroute.hops is not None:
-                log.info(f"Traceroute to destination '{host}' finished")
-                log_tests.info(f"Traceroute to destination '{host}' finished")
-                self._on_traceroute_finish()
+                if self._traceroute.hops is not None:
+                    log.info(f"Traceroute to destination '{host}' finished")
+                    log_tests.info(f"Traceroute to destination '{host}' finished")
+                    self._on_traceroute_finish()
+            finally:
+                with self._traceroute_lock:
+                    self._traceroute_running = False
+                    pending, self._pending_traceroute = self._pending_traceroute, None
+                    if pending is not None and self._running:
+                        self._start_traceroute(*pending)
 
+        self._traceroute_running = True
         self._traceroute = Traceroute(host, *args, on_error=self._on_traceroute_error, **kwargs)
-        self._traceroute_thread = threading.Thread(target=wrapper, name='traceroute')
-        self._traceroute_thread.start()
+        self._traceroute_future = _executor.submit(wrapper)
 
-    def _wait_traceroute(self):
+    def _wait_traceroute(self, timeout=None):
         log.debug('Wait traceroute')
 
-        if self._traceroute_thread:
-            self._traceroute_thread.join()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        # A queued traceroute is started before the running one finishes, so it's waited for as well
+        future = self._traceroute_future
+        while future:
+            remaining = max(deadline - time.monotonic(), 0.0) if deadline is not None else None
+            try:
+                future.result(remaining)
+            except concurrent.futures.TimeoutError:
+                log.warning(
+                    f"Traceroute to destination '{self._traceroute.host}' is taking too long, continuing without it. "
+                    f"Traceroutes requested meanwhile run once it finishes"
+                )
+                return
+            except Exception:
+                log.debug('Error running traceroute', exc_info=True)
+
+            if self._traceroute_future is future:
+                return
+            future = self._traceroute_future
 
     def _on_traceroute_finish(self):
         log_tests.info(self._traceroute.format())
@@ -769,8 +1120,8 @@ def _on_traceroute_error(self, exception):
     def _run_speed_test(self, *args, **kwargs):
         log.debug('Run speed test')
 
-        if self._speed_test_thread and self._speed_test_thread.is_alive():
-            log.debug('Attempted to run speed test while thread is alive')
+        if self._speed_test_future and not self._speed_test_future.done():
+            log.debug('Attempted to run speed test while previous speed test is running')
             return
 
         def wrapper():
@@ -784,14 +1135,16 @@ def wrapper():
                 self._on_speed_test_finish()
 
         self._speed_test = SpeedTest(*args, on_error=self._on_speed_test_error, **kwargs)
-        self._speed_test_thread = threading.Thread(target=wrapper, name='speed-test')
-        self._speed_test_thread.start()
+        self._speed_test_future = _executor.submit(wrapper)
 
     def _wait_speed_test(self):
         log.debug('Wait speed test')
 
-        if self._speed_test_thread:
-            self._speed_test_thread.join()
+        if self._speed_test_future:
+            try:
+                self._speed_test_future.result()
+            except Exception:
+                log.debug('Error running speed test', exc_info=True)
 
     def _on_speed_test_finish(self):
         log_tests.debug(self._speed_test.format())
@@ -804,20 +1157,21 @@ def _on_speed_test_error(self, exception):
     def _start_event_log_listener(self):
         log.debug('Start event log listener')
 
-        if self._event_log_listener_thread and self._event_log_listener_thread.is_alive():
-            log.debug('Attempted to start event listener while thread is alive')
+        if self._event_log_listener:
+            log.debug('Attempted to start event listener while subscribed')
             return
 
+        # The subscription invokes the handler on a system thread for every event,
+        # so no thread is needed to wait for events
         self._event_log_listener = EventLogListener(
             on_event=self._on_event_log_record,
             on_error=self._on_event_log_error
         )
-        self._event_log_listener_thread = threading.Thread(
-            target=self._event_log_listener.listen,
-            name='event-log',
-            daemon=True
-        )
-        self._event_log_listener_thread.start()
+        try:
+            self._event_log_listener.listen()
+        except Exception:
+            # The error has already been reported by the listener
+            return
 
         log.info('Event log listener started')
         log_event_log.info('Event log listener started')
@@ -827,9 +1181,13 @@ def _stop_event_log_listener(self):
 
         if self._event_log_listener:
             self._event_log_listener.stop()
-            self._event_log_listener_thread.join()
+            self._event_log_listener = None
 
     def _on_event_log_record(self, record):
+        # Invoked on the system thread of the subscription, which is released as soon as possible
+        self._dispatch_callback(self._log_event_log_record, record)
+
+    def _log_event_log_record(self, record):
         log_event_log.info(EventLogListener.format_record(record))
 
     def _on_event_log_error(self, exception):
@@ -840,12 +1198,15 @@ def _on_event_log_error(self, exception):
 
 class NetworkInterface:
 
+    __slots__ = ('_id', '_name', '_mac_address', '_ipv4_address', '_gateway_ipv4_address', '_identity')
+
     def __init__(self, id_, name, mac_address, _ipv4_address, gateway_ipv4_address):
         self._id = id_
         self._name = name
         self._mac_address = mac_address
         self._ipv4_address = _ipv4_address
         self._gateway_ipv4_address = gateway_ipv4_address
+        self._identity = (id_, name, mac_address, _ipv4_address, gateway_ipv4_address)
 
     @property
     def id(self):
@@ -867,14 +1228,23 @@ def ipv4_address(self):
     def gateway_ipv4_address(self):
         return self._gateway_ipv4_address
 
-    @classmethod
-    def from_default_gateway(cls):
+    @property
+    def identity(self):
+        return self._identity
+
+    @staticmethod
+    def get_default_gateway():
         gateways = netifaces.gateways()
         default_gateway = gateways['default'].get(netifaces.AF_INET)
         if not default_gateway:
             raise ValueError('No default gateway present')
-        gateway_ipv4_address = default_gateway[0]
-        interface_id = default_gateway[1]
+        return default_gateway[0], default_gateway[1]
+
+    @classmethod
+    def from_default_gateway(cls, default_gateway=None):
+        if default_gateway is None:
+            default_gateway = cls.get_default_gateway()
+        gateway_ipv4_address, interface_id = default_gateway
 
         addresses = netifaces.ifaddresses(interface_id)
         if not addresses:
@@ -890,22 +1260,14 @@ def from_default_gateway(cls):
             raise ValueError(f"No IPv4 addresses found for interface '{interface_id}'")
         interface_ipv4_address = ipv4_addresses[0]['addr']
 
-        interface_name = None
-        for name, addresses in psutil.net_if_addrs().items():
-            for address in addresses:
-                if address.family == psutil.AF_LINK and interface_mac_address == address.address:
-                    interface_name = name
-                    break
-            else:
-                continue
-            break
+        interface_name = _get_interface_name(interface_id)
         if not interface_name:
-            raise ValueError(f"No network names found by MAC address matching for interface '{interface_id}'")
+            raise ValueError(f"No network name found for interface '{interface_id}'")
 
         return cls(interface_id, interface_name, interface_mac_address, interface_ipv4_address, gateway_ipv4_address)
 
     def get_stats(self):
-        interface_stats = psutil.net_if_stats().get(self._name)
+        interface_stats = _get_interface_stats().get(self._name)
         if not interface_stats:
             raise ValueError(f"No stats found for interface '{self._id}'")
 
@@ -922,12 +1284,61 @@ def get_stats(self):
         }
 
 
+class InterfaceChangeListener:
+
+    AF_UNSPEC = 0
+
+    def __init__(self, on_change=None):
+        self._on_change = on_change
+        self._handle = None
+        self._callback = None
+
+    def listen(self):
+        if self._handle is not None:
+            return
+
+        iphlpapi = ctypes.windll.iphlpapi
+
+        # VOID (*PIPINTERFACE_CHANGE_CALLBACK)(PVOID CallerContext, PMIB_IPINTERFACE_ROW Row, MIB_NOTIFICATION_TYPE NotificationType)
+        callback_type = ctypes.WINFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)
+
+        # Keep a reference to the callback for as long as the notifications are registered
+        callback = callback_type(self._handler)
+        handle = ctypes.c_void_p()
+
+        iphlpapi.NotifyIpInterfaceChange.argtypes = (
+            ctypes.c_ushort,
+            callback_type,
+            ctypes.c_void_p,
+            ctypes.c_bool,
+            ctypes.POINTER(ctypes.c_void_p)
+        )
+        result = iphlpapi.NotifyIpInterfaceChange(self.AF_UNSPEC, callback, None, False, ctypes.byref(handle))
+        if result != 0:
+            raise OSError(result, 'Failed to register IP interface change notifications')
+
+        self._callback = callback
+        self._handle = handle
+
+    def stop(self):
+        if self._handle is not None:
+            ctypes.windll.iphlpapi.CancelMibChangeNotify2(self._handle)
+            self._handle = None
+            self._callback = None
+
+    def _handler(self, caller_context, row, notification_type):
+        if self._on_change is not None:
+            self._on_change()
+
+
 class RTTData:
 
-    def __init__(self, host):
+    HEADER = 'Avg     Min     Max     Jitter  Sent Recv Loss'
+    NO_RTT_COLUMNS = '-       -       -       -       '
+
+    def __init__(self, host, window_size=256):
         self._host = host
 
-        self._initial_data = False
         self._last = None
         self._average = None
         self._minimum = None
@@ -936,17 +1347,25 @@ def __init__(self, host):
         self._sent = 0
         self._received = 0
 
+        # The RTT statistics cover only the latest samples, so that old spikes don't dominate them.
+        # Sums are kept for the averages, and candidates for the extremes in monotonic order with their indexes
+        self._window_size = window_size
+        self._window = collections.deque(maxlen=window_size)
+        self._window_sum = 0.0
+        self._jitters = collections.deque(maxlen=window_size - 1)
+        self._jitters_sum = 0.0
+        self._minimums = collections.deque()
+        self._maximums = collections.deque()
+
     def __str__(self):
-        if not self._initial_data:
+        if not self._received:
             return (
-                f'Host: {self._host}\n'
-                'Avg     Min     Max     Jitter  Sent Recv Loss\n'
-                f'-       -       -       -       {self._sent:<4} {self._received:<4} {self.loss * 100:>5.1f}%'
+                f'Host: {self._host}\n{RTTData.HEADER}\n{RTTData.NO_RTT_COLUMNS}'
+                f'{self._sent:<4} {self._received:<4} {self.loss * 100:>5.1f}%'
             )
 
         return (
-            f'Host: {self._host}\n'
-            'Avg     Min     Max     Jitter  Sent Recv Loss\n'
+            f'Host: {self._host}\n{RTTData.HEADER}\n'
             f'{self._average:<7.3f} {self._minimum:<7.3f} {self._maximum:<7.3f} {self._jitter:<7.3f} '
             f'{self._sent:<4} {self._received:<4} {self.loss * 100:>5.1f}%'
         )
@@ -957,7 +1376,7 @@ def host(self):
 
     @property
     def initial_data(self):
-        return self._initial_data
+        return self._received > 0
 
     @property
     def last(self):
@@ -1006,33 +1425,252 @@ def update(self, latency):
         latency = float(latency)
         self._sent += 1
         self._received += 1
+        index = self._received
+
+        if len(self._window) == self._window_size:
+            self._window_sum -= self._window[0]
+        self._window.append(latency)
+        self._window_sum += latency
+
+        if self._last is not None:
+            jitter = abs(latency - self._last)
+            if len(self._jitters) == self._jitters.maxlen:
+                self._jitters_sum -= self._jitters[0]
+            self._jitters.append(jitter)
+            self._jitters_sum += jitter
+
+        # Recalculate the sums once per window to discard accumulated rounding errors
+        if index % self._window_size == 0:
+            self._window_sum = math.fsum(self._window)
+            self._jitters_sum = math.fsum(self._jitters)
+
+        while self._minimums and self._minimums[-1][1] >= latency:
+            self._minimums.pop()
+        self._minimums.append((index, latency))
+        if self._minimums[0][0] <= index - self._window_size:
+            self._minimums.popleft()
+
+        while self._maximums and self._maximums[-1][1] <= latency:
+            self._maximums.pop()
+        self._maximums.append((index, latency))
+        if self._maximums[0][0] <= index - self._window_size:
+            self._maximums.popleft()
 
-        if not self._initial_data:
-            self._last = latency
-            self._average = latency
-            self._minimum = latency
-            self._maximum = latency
-            self._jitter = 0.0
-            self._initial_data = True
+        self._last = latency
+        self._average = self._window_sum / len(self._window)
+        self._minimum = self._minimums[0][1]
+        self._maximum = self._maximums[0][1]
+        self._jitter = self._jitters_sum / len(self._jitters) if self._jitters else 0.0
+
+
+class ICMPProbe:
+
+    __slots__ = ('name', 'label', 'cb_on_start', 'cb_on_update', 'rtt_format', 'late_rtt_format', 'connectivity',
+                 'test', 'address', 'seq_loss', 'last_update_time')
+
+    def __init__(self, name, label, cb_on_start=None, cb_on_update=None, rtt_precision=None, connectivity=False):
+        self.name = name
+        self.label = label
+        self.cb_on_start = cb_on_start
+        self.cb_on_update = cb_on_update
+        self.rtt_format = '%s (%s): %s' if rtt_precision is None else f'%s (%s): %.{rtt_precision}f'
+        self.late_rtt_format = f'{self.rtt_format} (late)'
+        # Whether the test results determine internet connectivity
+        self.connectivity = connectivity
+
+        self.test = None
+        # The address the test is currently configured for, only accessed from the watchdog thread
+        self.address = None
+        # Only updated from the ICMP scheduler thread
+        self.seq_loss = 0
+        self.last_update_time = 0.0
+
+
+class ICMPScheduler:
+
+    def __init__(self, batch_window=0.01):
+        self._batch_window = batch_window
+        self._tests = set()
+        # Raw sockets receive every ICMP reply, so a single socket per address family is shared by all tests
+        # and replies are routed to the tests by their identifier
+        self._sockets = {}
+        self._tests_by_id = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._selector = None
+        self._waker = None
+        self._waker_reader = None
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        if self._thread and self._thread.is_alive():
+            return True
+        return False
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
             return
+        self._running = True
 
-        self._average = (self._sent * self._average + latency) / (self._sent + 1)
+        self._selector = selectors.DefaultSelector()
+        self._waker_reader, self._waker = socket.socketpair()
+        self._waker_reader.setblocking(False)
+        self._waker.setblocking(False)
+        self._selector.register(self._waker_reader, selectors.EVENT_READ)
 
-        if latency < self._minimum:
-            self._minimum = latency
+        self._thread = threading.Thread(target=self._run, name='icmp-scheduler', daemon=True)
+        self._thread.start()
 
-        if latency > self._maximum:
-            self._maximum = latency
+    def stop(self):
+        self._running = False
+        self._wake()
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def add(self, test, delay=0.0):
+        with self._lock:
+            self._pending.append((test, delay, None))
+        self._wake()
+
+    def remove(self, test):
+        if threading.current_thread() is self._thread or not self.running:
+            self._discard(test)
+            return
 
-        last_jitter = abs(latency - self._last)
-        self._jitter = (self._sent * self._jitter + last_jitter) / (self._sent + 1)
+        # Wait for the scheduler thread to discard the test, so that no callbacks are invoked afterwards
+        removed = threading.Event()
+        with self._lock:
+            self._pending.append((test, None, removed))
+        self._wake()
+        while not removed.wait(0.1):
+            if not self.running:
+                self._discard(test)
+                break
 
-        self._last = latency
+    def _wake(self):
+        try:
+            self._waker.send(b'\0')
+        except (AttributeError, OSError):
+            pass
+
+    def _run(self):
+        try:
+            while self._running:
+                self._apply_pending()
+
+                now = time.monotonic()
+                deadline = min((test.deadline for test in self._tests), default=None)
+                timeout = max(deadline - now, 0.0) if deadline is not None else None
+
+                for key, _ in self._selector.select(timeout):
+                    if key.fileobj is self._waker_reader:
+                        self._drain_waker()
+                        continue
+                    self._receive(key.data)
+
+                # Echoes due within the batch window are sent together, so that tests share wakeups
+                now = time.monotonic()
+                for test in list(self._tests):
+                    self._call(test, test.poll, now, self._batch_window)
+        finally:
+            self._apply_pending()
+            for test in list(self._tests):
+                self._discard(test)
+            for icmp_socket in list(self._sockets.values()):
+                self._close_socket(icmp_socket)
+
+            self._selector.close()
+            self._waker.close()
+            self._waker_reader.close()
+
+    def _apply_pending(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+
+        for test, delay, removed in pending:
+            if removed is not None:
+                self._discard(test)
+                removed.set()
+            elif self._running:
+                self._call(test, self._open, test, delay)
+            else:
+                test.close()
+
+    def _open(self, test, delay):
+        test.open(time.monotonic() + delay, self._get_socket)
+        self._tests.add(test)
+        self._tests_by_id[test.id] = test
+
+    def _discard(self, test):
+        if test in self._tests:
+            self._tests.discard(test)
+            if self._tests_by_id.get(test.id) is test:
+                del self._tests_by_id[test.id]
+        test.close()
+
+    def _get_socket(self, address):
+        ipv6 = icmplib.utils.is_ipv6_address(address)
+        icmp_socket = self._sockets.get(ipv6)
+        if icmp_socket is None:
+            icmp_socket = (icmplib.ICMPv6Socket if ipv6 else icmplib.ICMPv4Socket)(None, True)
+            icmp_socket.sock.setblocking(False)
+            self._selector.register(icmp_socket.sock, selectors.EVENT_READ, icmp_socket)
+            self._sockets[ipv6] = icmp_socket
+        return icmp_socket
+
+    def _close_socket(self, icmp_socket):
+        for ipv6, socket_ in list(self._sockets.items()):
+            if socket_ is icmp_socket:
+                del self._sockets[ipv6]
+        self._selector.unregister(icmp_socket.sock)
+        icmp_socket.close()
+
+    def _receive(self, icmp_socket):
+        # Drain all queued replies in a single wakeup. The socket is read directly, since receiving through icmplib
+        # without a timeout fails on an empty socket and drops replies queued behind foreign packets
+        while True:
+            try:
+                packet, source = icmp_socket.sock.recvfrom(1024)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                # The socket is no longer usable, so every test using it fails and gets a new socket on restart
+                self._close_socket(icmp_socket)
+                for test in list(self._tests):
+                    if test.socket is icmp_socket:
+                        self._discard(test)
+                        test.error(e)
+                return
+
+            reply = icmp_socket._parse_reply(packet, source[0], time.time())
+            if reply is None:
+                continue
+            test = self._tests_by_id.get(reply.id)
+            if test is not None:
+                self._call(test, test.handle_reply, reply)
+
+    def _call(self, test, function, *args):
+        try:
+            function(*args)
+        except (icmplib.ICMPLibError, OSError) as e:
+            self._discard(test)
+            test.error(e)
+
+    def _drain_waker(self):
+        try:
+            while self._waker_reader.recv(1024):
+                pass
+        except OSError:
+            pass
 
 
 class ICMPTest:
 
-    def __init__(self, host, interval=1.0, timeout=2.0, on_update=None, on_error=None):
+    def __init__(self, host, interval=1.0, timeout=2.0, on_update=None, on_error=None, scheduler=None):
         self._host = host
         self._rtt_data = None
 
@@ -1040,8 +1678,16 @@ def __init__(self, host, interval=1.0, timeout=2.0, on_update=None, on_error=Non
         self._timeout = timeout
         self._on_update = on_update
         self._on_error = on_error
+        self._scheduler = scheduler
         self._running = False
 
+        self._socket = None
+        self._id = None
+        self._sequence = 0
+        # Requests awaiting a reply and their deadlines by sequence, as more than one may be outstanding
+        self._pending = {}
+        self._next_send_time = None
+
     @property
     def host(self):
         return self._host
@@ -1054,71 +1700,95 @@ def rtt_data(self):
     def running(self):
         return self._running
 
-    def run(self):
-        self._running = True
-
-        if icmplib.utils.is_hostname(self._host):
-            try:
-                address = icmplib.utils.resolve(self._host)[0]
-            except icmplib.NameLookupError as e:
-                self._error(e)
-                return
-        else:
-            address = self._host
-
-        self._rtt_data = RTTData(address)
-
-        if icmplib.utils.is_ipv6_address(address):
-            icmp_socket = icmplib.ICMPv6Socket
-        else:
-            icmp_socket = icmplib.ICMPv4Socket
-
-        id_ = icmplib.utils.unique_identifier()
-        count = 0
-
-        try:
-            with icmp_socket(None, True) as sock:
+    @property
+    def id(self):
+        return self._id
 
-                while self._running:
-                    if count > 0 and self._interval > 0:
-                        time.sleep(self._interval)
+    @property
+    def socket(self):
+        return self._socket
 
-                    request = icmplib.ICMPRequest(address, id_, count)
+    @property
+    def deadline(self):
+        deadline = self._next_send_time
+        for _, request_deadline in self._pending.values():
+            if request_deadline < deadline:
+                deadline = request_deadline
+        return deadline
+
+    def run(self, delay=0.0):
+        self._running = True
+        self._scheduler.add(self, delay)
 
-                    try:
-                        sock.send(request)
-                        reply = sock.receive(request, self._timeout)
-                        reply.raise_for_status()
-                        rtt = (reply.time - request.time) * 1000
-                        self._update(rtt)
+    def stop(self):
+        self._running = False
+        self._scheduler.remove(self)
 
-                    except icmplib.TimeoutExceeded:
-                        self._update(None)
+    def open(self, start_time, get_socket):
+        address = _resolve_address(self._host)
 
-                    count += 1
+        self._rtt_data = RTTData(address)
+        self._socket = get_socket(address)
+        self._id = icmplib.utils.unique_identifier()
+        self._sequence = 0
+        self._pending = {}
+        self._next_send_time = start_time
+
+    def close(self):
+        # The socket is owned by the scheduler
+        self._running = False
+        self._socket = None
+
+    def poll(self, now, window=0.0):
+        expired = [sequence for sequence, (_, deadline) in self._pending.items() if now >= deadline]
+        for sequence in expired:
+            del self._pending[sequence]
+            self._update(None)
+
+        # Requests are sent on a fixed schedule, regardless of when the replies to previous requests arrive
+        if now + window >= self._next_send_time:
+            request = icmplib.ICMPRequest(self._rtt_data.host, self._id, self._sequence)
+            self._socket.send(request)
+            self._pending[self._sequence] = (request, now + self._timeout)
+            self._sequence = (self._sequence + 1) & 0xFFFF
+
+            # Keep to the original schedule, but skip the slots missed while the scheduler was stalled
+            # instead of sending them all at once
+            self._next_send_time += self._interval
+            if self._next_send_time <= now:
+                missed = (now - self._next_send_time) // self._interval + 1
+                self._next_send_time += missed * self._interval
+
+    def handle_reply(self, reply):
+        if reply.id != self._id:
+            return
+        pending = self._pending.pop(reply.sequence, None)
+        if pending is None:
+            return
+        request = pending[0]
 
-        except icmplib.ICMPLibError as e:
-            self._error(e)
+        reply.raise_for_status()
+        rtt = (reply.time - request.time) * 1000
+        self._update(rtt)
 
-    def stop(self):
+    def error(self, exception):
         self._running = False
 
+        if self._on_error is not None:
+            self._on_error(exception)
+
     def _update(self, current_rtt):
         self._rtt_data.update(current_rtt)
 
         if self._on_update is not None:
             self._on_update(self._rtt_data, lost=current_rtt is None)
 
-    def _error(self, exception):
-        self._running = False
-
-        if self._on_error is not None:
-            self._on_error(exception)
-        raise
-
 
 class Traceroute:
 
+    HEADER = 'Hop Host            Avg     Min     Max     Jitter  Sent Recv Loss'
+    NO_REPLY_COLUMNS = '*               -       -       -       -       -    -    100.0%'
+
     def __init__(self, host, count=2, interval=0.0, timeout=2.0, max_hops=30, fast=False, on_error=None):
         self._host = host
         self._count = count
@@ -1141,32 +1811,100 @@ def run(self):
         self._hops = None
 
         try:
-            self._hops = icmplib.traceroute(
-                address=self._host,
-                count=self._count,
-                interval=self._interval,
-                timeout=self._timeout,
-                max_hops=self._max_hops,
-                fast=self._fast
-            )
+            self._hops = self._trace()
         except icmplib.ICMPLibError as e:
             self._error(e)
 
+    def _trace(self):
+        address = _resolve_address(self._host)
+
+        if icmplib.utils.is_ipv6_address(address):
+            icmp_socket = icmplib.ICMPv6Socket
+        else:
+            icmp_socket = icmplib.ICMPv4Socket
+
+        id_ = icmplib.utils.unique_identifier()
+        sequence = 0
+        # Number of probes sent, and address of the first responder with the RTTs of every hop by distance
+        sent = {}
+        responses = {}
+        # Distance at which the destination has responded
+        destination_distance = self._max_hops
+
+        with icmp_socket(None, True) as sock:
+            for i in range(self._count):
+                # When fast, hops that have already responded are not probed again
+                distances = [
+                    distance
+                    for distance in range(1, destination_distance + 1)
+                    if not self._fast or distance not in responses
+                ]
+                if not distances:
+                    break
+
+                if i > 0 and self._interval > 0:
+                    time.sleep(self._interval)
+
+                # Probes for all distances are sent at once, so a round takes at most a single timeout
+                requests = {}
+                for distance in distances:
+                    request = icmplib.ICMPRequest(address, id_, sequence, ttl=distance)
+                    sequence += 1
+                    sock.send(request)
+                    sent[distance] = sent.get(distance, 0) + 1
+                    requests[request.sequence] = request
+
+                deadline = time.monotonic() + self._timeout
+                while requests:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+
+                    try:
+                        reply = sock.receive(None, timeout)
+                    except icmplib.TimeoutExceeded:
+                        break
+
+                    if reply.id != id_:
+                        continue
+                    request = requests.pop(reply.sequence, None)
+                    if request is None:
+                        continue
+
+                    distance = request.ttl
+                    rtt = (reply.time - request.time) * 1000
+                    if distance not in responses:
+                        responses[distance] = (reply.source, [])
+                    responses[distance][1].append(rtt)
+
+                    # Probes past the destination are no longer waited for
+                    if reply.source == address and distance < destination_distance:
+                        destination_distance = distance
+                        requests = {
+                            sequence_: request_
+                            for sequence_, request_ in requests.items()
+                            if request_.ttl < distance
+                        }
+
+        return [
+            icmplib.Hop(responses[distance][0], sent[distance], responses[distance][1], distance)
+            for distance in sorted(responses)
+            if distance <= destination_distance
+        ]
+
     def format(self):
         if self._hops is None:
             raise ValueError('No traceroute data')
 
-        lines = []
-        lines.append(f'Host: {self._host}')
-        lines.append('Hop Host            Avg     Min     Max     Jitter  Sent Recv Loss')
+        lines = [f'Host: {self._host}', Traceroute.HEADER]
 
         last_distance = 0
 
         for hop in self._hops:
-            for i in range(last_distance + 1, hop.distance):
-                line = f'{i:<2}  *               -       -       -       -       -    -    100.0%'
-                lines.append(line)
-
+            lines.extend(
+                f'{i:<2}  {Traceroute.NO_REPLY_COLUMNS}'
+                for i in range(last_distance + 1, hop.distance)
+            )
             last_distance = hop.distance
 
             loss_percent = (1 - hop.packets_received / hop.packets_sent) * 100
@@ -1187,6 +1925,8 @@ def _error(self, exception):
 class SpeedTest:
 
     LATENCY_TEST = cfspeedtest.TestSpec(1, 20, 'latency', cfspeedtest.TestType.Down)
+    # The tests are run one after another on purpose, download and upload running at the same time would compete
+    # for the link and skew both results
     SHORT_TESTS = (
         LATENCY_TEST,
         cfspeedtest.TestSpec(5_000_000, 4, '20MB', cfspeedtest.TestType.Down),
@@ -1244,13 +1984,17 @@ def _error(self, exception):
 
 class EventLogListener:
 
-    LEVELS = {
-        0: 'LogAlways',
-        1: 'Critical',
-        2: 'Error',
-        3: 'Warning',
-        4: 'Informational',
-        5: 'Verbose'
+    LEVELS = (
+        'LogAlways',
+        'Critical',
+        'Error',
+        'Warning',
+        'Informational',
+        'Verbose'
+    )
+
+    NAMESPACES = {
+        'event': 'http://schemas.microsoft.com/win/2004/08/events/event'
     }
 
     def __init__(self, log='System', on_event=None, on_error=None):
@@ -1258,6 +2002,9 @@ def __init__(self, log='System', on_event=None, on_error=None):
         self._on_event = on_event
         self._on_error = on_error
         self._subscription = None
+        # Publisher metadata is needed for formatting messages and is opened once per provider
+        self._publisher_metadata = {}
+        self._publisher_metadata_lock = threading.Lock()
 
     def listen(self):
         if self._subscription is not None:
@@ -1274,9 +2021,26 @@ def listen(self):
             self._error(e)
 
     def stop(self):
+        # Closing the subscription waits for the handler, so the metadata is no longer used by it afterwards
         if self._subscription is not None:
             self._subscription.Close()
             self._subscription = None
+        with self._publisher_metadata_lock:
+            self._publisher_metadata.clear()
+
+    @staticmethod
+    def format_level(level):
+        # Providers may define their own levels above the standard ones
+        if level < len(EventLogListener.LEVELS):
+            return EventLogListener.LEVELS[level]
+        return str(level)
+
+    @staticmethod
+    def format_event_data_strings(event_data_strings):
+        return '\n'.join(
+            f'{name}: {value}' if name is not None else value
+            for name, value in event_data_strings
+        )
 
     @staticmethod
     def format_record(record):
@@ -1291,63 +2055,107 @@ def format_record(record):
             f"Channel: {record['channel']}\n"
             f"Provider: {record['provider']}\n"
             f"Source: {record['source']}\n"
-            f"Level: {EventLogListener.LEVELS[record['level']]}\n"
+            f"Level: {EventLogListener.format_level(record['level'])}\n"
             f"OpCode: {record['opcode']}\n"
 
             f"Message:\n{record['message']}"
             if record['message'] is not None else
 
-            f"Event Data:\n{'\n'.join(record['event_data_strings'])}"
+            f"Event Data:\n{EventLogListener.format_event_data_strings(record['event_data_strings'])}"
             if record['event_data_strings'] is not None else
 
             f"User Data:\n{record['user_data']}"
             if record['user_data'] is not None else
 
-            f"Raw:\n{record['raw']}"
+            f"Raw:\n{EventLogListener.format_xml(record['raw'])}"
         )
 
+    @staticmethod
+    def format_xml(xml):
+        root = ElementTree.fromstring(xml)
+        ElementTree.indent(root, ' ' * 2)
+        return EventLogListener._xml_to_string(root)
+
+    @staticmethod
+    def _xml_to_string(element):
+        # The event namespace is written as the default one, as in the event log, instead of with a generated prefix.
+        # The element is changed in place, as it's only serialized afterwards
+        namespace = EventLogListener.NAMESPACES['event']
+        prefix = f'{{{namespace}}}'
+        for node in element.iter():
+            if isinstance(node.tag, str) and node.tag.startswith(prefix):
+                node.tag = node.tag[len(prefix):]
+        element.set('xmlns', namespace)
+        return ElementTree.tostring(element, encoding='unicode')
+
     def _error(self, exception):
         if self._on_error is not None:
             self._on_error(exception)
         raise
 
-    def _handler(self, action, context, event):
-        if action == win32evtlog.EvtSubscribeActionError:
-            return
+    def _format_message(self, event, provider_name):
+        metadata = self._get_publisher_metadata(provider_name)
+        if metadata is None:
+            return None
 
         try:
-            event_data_xml = win32evtlog.EvtFormatMessage(None, event, win32evtlog.EvtFormatMessageXml)
-
-            with xml.dom.minidom.parseString(event_data_xml) as dom:
-                root = dom.getElementsByTagName('Event')[0]
+            return win32evtlog.EvtFormatMessage(metadata, event, win32evtlog.EvtFormatMessageEvent) or None
+        except Exception:
+            # Not every event has a message defined by its provider
+            return None
 
-                system = root.getElementsByTagName('System')[0]
+    def _get_publisher_metadata(self, provider_name):
+        with self._publisher_metadata_lock:
+            if provider_name in self._publisher_metadata:
+                return self._publisher_metadata[provider_name]
 
-                provider = system.getElementsByTagName('Provider')[0]
-                provider_name = provider.getAttribute('Name')
-                source_name = provider.getAttribute('EventSourceName') or None
-
-                level = system.getElementsByTagName('Level')[0].firstChild.nodeValue
-                opcode = system.getElementsByTagName('Opcode')[0].firstChild.nodeValue
-                time_created = system.getElementsByTagName('TimeCreated')[0].getAttribute('SystemTime')
-                channel = system.getElementsByTagName('Channel')[0].firstChild.nodeValue
-
-                event_data_nodes = root.getElementsByTagName('EventData')
-                event_data_strings = None
-                if event_data_nodes:
-                    event_data = event_data_nodes[0]
-                    event_data_strings = [
-                        (node.getAttribute('Name') or None, node.firstChild.nodeValue)
-                        for node in event_data.childNodes
-                        if node.firstChild.nodeType == node.TEXT_NODE
-                    ]
+            try:
+                metadata = win32evtlog.EvtOpenPublisherMetadata(provider_name)
+            except Exception:
+                metadata = None
+            self._publisher_metadata[provider_name] = metadata
+            return metadata
 
-                user_data_nodes = root.getElementsByTagName('UserData')
-                user_data = None
-                if user_data_nodes:
-                    user_data = user_data_nodes[0].toprettyxml(' ' * 2)
+    def _handler(self, action, context, event):
+        if action == win32evtlog.EvtSubscribeActionError:
+            return
 
-                message = root.getElementsByTagName('Message')[0].nodeValue or None
+        try:
+            # Rendering only the event is cheaper than formatting all of its strings into the XML
+            event_data_xml = win32evtlog.EvtRender(event, win32evtlog.EvtRenderEventXml)
+
+            root = ElementTree.fromstring(event_data_xml)
+            ns = EventLogListener.NAMESPACES
+
+            system = root.find('event:System', ns)
+
+            provider = system.find('event:Provider', ns)
+            provider_name = provider.get('Name')
+            source_name = provider.get('EventSourceName') or None
+
+            # Converted once here, so that the level can be looked up by index when formatting
+            level = int(system.findtext('event:Level', '0', ns))
+            opcode = int(system.findtext('event:Opcode', '0', ns))
+            time_created = system.find('event:TimeCreated', ns).get('SystemTime')
+            channel = system.findtext('event:Channel', None, ns)
+
+            event_data = root.find('event:EventData', ns)
+            event_data_strings = None
+            if event_data is not None:
+                event_data_strings = [
+                    (node.get('Name') or None, node.text)
+                    for node in event_data
+                    if node.text is not None
+                ]
+
+            # The event handle is only valid in the handler, so the message is formatted here
+            message = self._format_message(event, provider_name)
+
+            user_data_node = root.find('event:UserData', ns)
+            user_data = None
+            if user_data_node is not None:
+                ElementTree.indent(user_data_node, ' ' * 2)
+                user_data = EventLogListener._xml_to_string(user_data_node)
 
         except Exception as e:
             self._error(e)
@@ -1363,7 +2171,8 @@ def _handler(self, action, context, event):
             'message': message,
             'event_data_strings': event_data_strings,
             'user_data': user_data,
-            'raw': root.toprettyxml(' ' * 2)
+            # Only pretty-printed when formatted, as it is rarely needed
+            'raw': event_data_xml
         }
         self._on_event(record)
 
@@ -1,11 +1,8 @@
 import sys
 
-from darkdetect import theme
 from PySide6.QtWidgets import QApplication, QMessageBox
-from qdarktheme import load_palette, load_stylesheet
 
 from ..utils import is_running_as_admin
-from .main_window import MainWindow
 
 
 def gui_main():
@@ -19,6 +16,12 @@ def gui_main():
         )
         sys.exit(1)
 
+    # Imported only after the privileges are checked, as loading the themes and the diagnostics takes a while
+    from darkdetect import theme
+    from qdarktheme import load_palette, load_stylesheet
+
+    from .main_window import MainWindow
+
     app_theme = 'light' if theme() == 'Light' else 'dark'
     stylesheet = load_stylesheet(app_theme)
     app.setStyleSheet(stylesheet)
@@ -1,10 +1,21 @@
 from datetime import datetime
 
-from PySide6.QtWidgets import QListWidgetItem, QMainWindow
+from PySide6.QtWidgets import QMainWindow
 
 from .generated.history_window import Ui_MainWindow
 
 
+def _parse_file_safe_datetime(string):
+    # Equivalent to strptime with '%Y-%m-%dT%H-%M-%S%z', but much faster
+    if len(string) < 19 or string[10] != 'T' or string[13] != '-' or string[16] != '-':
+        return None
+    try:
+        dt = datetime.fromisoformat(f'{string[:13]}:{string[14:16]}:{string[17:]}')
+    except ValueError:
+        return None
+    return dt if dt.tzinfo is not None else None
+
+
 class HistoryWindow(QMainWindow):
 
     def __init__(self, main_window, *args, **kwargs):
@@ -19,6 +30,7 @@ def __init__(self, main_window, *args, **kwargs):
         self.ui.delete_button.clicked.connect(self._on_delete_button)
         self.ui.delete_all_button.clicked.connect(self._on_delete_all_button)
         self.ui.diagnostics_history_list.itemSelectionChanged.connect(self._on_history_list_selection_change)
+        self.main_window.diagnostics_deleted.connect(self._on_diagnostics_deleted)
 
         self.history = None
         self.selected_index = None
@@ -30,18 +42,17 @@ def update_history(self, history):
         self.ui.browse_button.setEnabled(False)
         self.ui.delete_button.setEnabled(False)
         self.ui.delete_all_button.setEnabled(False)
-        self.ui.diagnostics_history_list.clear()
 
         if history:
             self.ui.delete_all_button.setEnabled(True)
 
+        item_names = []
         for name, path in history:
             name_split = name.split('.')
             if len(name_split) >= 2:
                 # Name should be file-safe ISO 8601 string + number
-                try:
-                    dt_utc = datetime.strptime(name_split[0], '%Y-%m-%dT%H-%M-%S%z')
-                except ValueError:
+                dt_utc = _parse_file_safe_datetime(name_split[0])
+                if dt_utc is None:
                     item_name = name_split[1]
                 else:
                     dt_str = dt_utc.astimezone().strftime('%Y-%m-%d %H:%M:%S')
@@ -49,15 +60,25 @@ def update_history(self, history):
 
             else:
                 # Name should be file-safe ISO 8601 string
-                try:
-                    dt_utc = datetime.strptime(name, '%Y-%m-%dT%H-%M-%S%z')
-                except ValueError:
+                dt_utc = _parse_file_safe_datetime(name)
+                if dt_utc is None:
                     item_name = name
                 else:
                     item_name = dt_utc.astimezone().strftime('%Y-%m-%d %H:%M:%S')
 
-            item = QListWidgetItem(item_name)
-            self.ui.diagnostics_history_list.addItem(item)
+            item_names.append(item_name)
+
+        # Rebuild the list in a single batch without repainting or notifying about every item
+        history_list = self.ui.diagnostics_history_list
+        history_list.setUpdatesEnabled(False)
+        history_list.blockSignals(True)
+        try:
+            history_list.clear()
+            history_list.addItems(item_names)
+        finally:
+            history_list.blockSignals(False)
+            history_list.setUpdatesEnabled(True)
+        self.selected_index = None
 
     def get_selected_index(self):
         selected_indexes = self.ui.diagnostics_history_list.selectedIndexes()
@@ -77,25 +98,29 @@ def _on_browse_button(self):
 
     def _on_delete_button(self):
         name, path = self.history[self.selected_index]
-        success = self.main_window.delete_diagnostics(name, path)
-        if not success:
-            return
-
-        del self.history[self.selected_index]
-        self.ui.diagnostics_history_list.takeItem(self.selected_index)
+        self.main_window.delete_diagnostics(name, path)
 
     def _on_delete_all_button(self):
-        success = self.main_window.delete_all_diagnostics()
-        if not success:
-            return
+        self.main_window.delete_all_diagnostics()
 
-        self.history.clear()
-        self.ui.diagnostics_history_list.clear()
+    # Main window handlers
 
-        self.ui.export_button.setEnabled(False)
-        self.ui.browse_button.setEnabled(False)
-        self.ui.delete_button.setEnabled(False)
-        self.ui.delete_all_button.setEnabled(False)
+    def _on_diagnostics_deleted(self, names):
+        if self.history is None:
+            return
+
+        deleted_names = set(names)
+        for index in reversed(range(len(self.history))):
+            name, path = self.history[index]
+            if name in deleted_names:
+                del self.history[index]
+                self.ui.diagnostics_history_list.takeItem(index)
+
+        if not self.history:
+            self.ui.export_button.setEnabled(False)
+            self.ui.browse_button.setEnabled(False)
+            self.ui.delete_button.setEnabled(False)
+            self.ui.delete_all_button.setEnabled(False)
 
     def _on_history_list_selection_change(self):
         self.selected_index = self.get_selected_index()
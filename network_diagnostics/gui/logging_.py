@@ -1,5 +1,7 @@
+import collections
+import threading
 from logging import Handler
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, QTimer, Signal
 
 
 class _SignalProxy(QObject):
@@ -9,11 +11,31 @@ class _SignalProxy(QObject):
 
 class SignalHandler(Handler):
 
-    def __init__(self, widget, *args, **kwargs):
+    def __init__(self, widget, *args, flush_interval=100, buffer_size=10000, **kwargs):
         super().__init__(*args, **kwargs)
         self._widget = widget
         self._signal_proxy = _SignalProxy()
         self.message = self._signal_proxy.message
 
+        # Records are emitted from any thread, so they are buffered and flushed periodically on the GUI thread
+        # as a single message, instead of crossing the thread boundary once per record
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._buffer_lock = threading.Lock()
+        self._flush_timer = QTimer(self._signal_proxy)
+        self._flush_timer.setInterval(flush_interval)
+        self._flush_timer.timeout.connect(self._flush_buffer)
+        self._flush_timer.start()
+
     def emit(self, record):
-        self.message.emit(self.format(record))
+        message = self.format(record)
+        with self._buffer_lock:
+            self._buffer.append(message)
+
+    def _flush_buffer(self):
+        with self._buffer_lock:
+            if not self._buffer:
+                return
+            messages = list(self._buffer)
+            self._buffer.clear()
+
+        self.message.emit('\n'.join(messages))
@@ -1,38 +1,136 @@
+import functools
 import logging
+import os
 import platform
 import shutil
+import stat
 import tarfile
 
-from PySide6.QtCore import QCoreApplication, Signal, qVersion
-from PySide6.QtGui import QClipboard, Qt
-from PySide6.QtWidgets import QFileDialog, QMainWindow, QMessageBox, QTableWidgetItem
+from PySide6.QtCore import QCoreApplication, QObject, QRunnable, QThreadPool, Signal, Slot, qVersion
+from PySide6.QtGui import QGuiApplication, Qt
+from PySide6.QtWidgets import QFileDialog, QMainWindow, QMessageBox, QProgressDialog
 from PySide6 import __version__ as __pyside_version__
 from qdarktheme import load_palette, load_stylesheet
 
 from ..diagnostics import Diagnostics, NetworkInterface, RTTData
+from ..logging_ import add_logging_handler
 from ..utils import get_diagnostics_dir, open_path_in_explorer, parse_cs2_ncs
 from ..version import __version__
 from .generated.main_window import Ui_MainWindow
 from .history_window import HistoryWindow
 from .logging_ import SignalHandler
+from .rtt_table_model import RTTTableModel
+from .throttle import qthrottled
 
 
 log = logging.getLogger('gui')
 
 
+class _ExportTaskSignals(QObject):
+
+    finished = Signal(bool, str)
+
+
+class _ExportTask(QRunnable):
+
+    def __init__(self, name, path, save_file):
+        super().__init__()
+        self._name = name
+        self._path = path
+        self._save_file = save_file
+        self.signals = _ExportTaskSignals()
+
+    def run(self):
+        try:
+            # The archive is only written sequentially, so the streaming mode is used
+            with tarfile.open(self._save_file, 'w|xz', format=tarfile.PAX_FORMAT) as tar_file:
+                self._add_directory(tar_file, str(self._path), self._name, os.stat(self._path))
+        except Exception as e:
+            log.debug(f"Error creating TAR file for diagnostics '{self._name}'", exc_info=True)
+            self.signals.finished.emit(False, str(e))
+            return
+
+        self.signals.finished.emit(True, '')
+
+    @staticmethod
+    def _create_tar_info(name, stat_result, type_):
+        tar_info = tarfile.TarInfo(name)
+        tar_info.type = type_
+        tar_info.mode = stat.S_IMODE(stat_result.st_mode)
+        tar_info.mtime = stat_result.st_mtime
+        if type_ == tarfile.REGTYPE:
+            tar_info.size = stat_result.st_size
+        return tar_info
+
+    @classmethod
+    def _add_directory(cls, tar_file, path, name, stat_result):
+        # Walk the directory with scandir, as its entries already carry the stats needed for the headers,
+        # instead of letting tarfile stat every path again
+        tar_file.addfile(cls._create_tar_info(name, stat_result, tarfile.DIRTYPE))
+
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+
+        for entry in entries:
+            entry_name = f'{name}/{entry.name}'
+            entry_stat = entry.stat(follow_symlinks=False)
+            if entry.is_dir(follow_symlinks=False):
+                cls._add_directory(tar_file, entry.path, entry_name, entry_stat)
+            elif entry.is_file(follow_symlinks=False):
+                with open(entry.path, 'rb') as file:
+                    tar_file.addfile(cls._create_tar_info(entry_name, entry_stat, tarfile.REGTYPE), file)
+
+
+class _DeleteTaskSignals(QObject):
+
+    progress = Signal(int)
+    finished = Signal(list, str)
+
+
+class _DeleteTask(QRunnable):
+
+    def __init__(self, items):
+        super().__init__()
+        self._items = items
+        self.signals = _DeleteTaskSignals()
+
+    def run(self):
+        deleted_names = []
+        error = ''
+        for name, path in self._items:
+            try:
+                log.debug(f"Deleting diagnostics directory '{path}'")
+                shutil.rmtree(str(path))
+            except OSError as e:
+                log.debug(f"Error deleting diagnostics directory '{path}'", exc_info=True)
+                error = f"Failed to delete diagnostics directory '{path}': {e}"
+                break
+
+            deleted_names.append(name)
+            self.signals.progress.emit(len(deleted_names))
+
+        self.signals.finished.emit(deleted_names, error)
+
+
 class MainWindow(QMainWindow):
 
+    # Text and style sheet of the CS2 console output parse status label for each status
+    CS2_NCS_PARSE_STATUSES = {
+        'empty': ('Waiting for input...', ''),
+        'error': ('Incorrect or incomplete CS2 console output. Please try again.', 'QLabel { color: #ff4040; }'),
+        'success': ('CS2 server connection information available.', 'QLabel { color: #10b010; }')
+    }
+
+    diagnostics_deleted = Signal(list)
+
     _s_on_diagnostics_stop = Signal()
     _s_on_interruption_start = Signal(int)
     _s_on_interruption_end = Signal()
     _s_on_interface_update = Signal(NetworkInterface)
     _s_on_interface_stats_update = Signal(dict)
-    _s_on_icmp_gateway_test_start = Signal(str)
-    _s_on_icmp_gateway_test_update = Signal(RTTData)
-    _s_on_icmp_external_test_start = Signal(str)
-    _s_on_icmp_external_test_update = Signal(RTTData)
-    _s_on_icmp_cs2_test_start = Signal(str)
-    _s_on_icmp_cs2_test_update = Signal(RTTData)
+    # ICMP tests are identified by their RTT table row
+    _s_on_icmp_test_start = Signal(int, str)
+    _s_on_icmp_test_update = Signal(int, RTTData)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -47,22 +145,26 @@ def __init__(self, *args, **kwargs):
         formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', '%H:%M:%S')
         signal_handler.setFormatter(formatter)
 
-        logging.getLogger().addHandler(signal_handler)
+        add_logging_handler(signal_handler)
 
         self._signal_handler = signal_handler
 
-        # Connect signals from Diagnostics callbacks
-        self._s_on_diagnostics_stop.connect(self._on_diagnostics_stop)
-        self._s_on_interruption_start.connect(self._on_interruption_start)
-        self._s_on_interruption_end.connect(self._on_interruption_end)
-        self._s_on_interface_update.connect(self._on_interface_update)
-        self._s_on_interface_stats_update.connect(self._on_interface_stats_update)
-        self._s_on_icmp_gateway_test_start.connect(self._on_icmp_gateway_test_start)
-        self._s_on_icmp_gateway_test_update.connect(self._on_icmp_gateway_test_update)
-        self._s_on_icmp_external_test_start.connect(self._on_icmp_external_test_start)
-        self._s_on_icmp_external_test_update.connect(self._on_icmp_external_test_update)
-        self._s_on_icmp_cs2_test_start.connect(self._on_icmp_cs2_test_start)
-        self._s_on_icmp_cs2_test_update.connect(self._on_icmp_cs2_test_update)
+        # RTT updates arrive for every ping, so the table is updated at most once per interval, with the latest data
+        self._rtt_row_throttlers = [
+            qthrottled(functools.partial(self._write_rtt_row, row), 100, self)
+            for row in range(3)
+        ]
+
+        # Connect signals from Diagnostics callbacks. The callbacks are always called from the diagnostics threads,
+        # so the connections are queued explicitly, instead of checking the thread on every emit
+        queued = Qt.ConnectionType.QueuedConnection
+        self._s_on_diagnostics_stop.connect(self._on_diagnostics_stop, queued)
+        self._s_on_interruption_start.connect(self._on_interruption_start, queued)
+        self._s_on_interruption_end.connect(self._on_interruption_end, queued)
+        self._s_on_interface_update.connect(self._on_interface_update, queued)
+        self._s_on_interface_stats_update.connect(self._on_interface_stats_update, queued)
+        self._s_on_icmp_test_start.connect(self._on_icmp_test_start, queued)
+        self._s_on_icmp_test_update.connect(self._on_icmp_test_update, queued)
 
         # Connect UI widgets signals
         self.ui.action_browse_all_diagnostics.triggered.connect(self.browse_all_diagnostics)
@@ -81,36 +183,52 @@ def __init__(self, *args, **kwargs):
         self.ui.diagnostics_toggle_button.toggled.connect(self._on_diagnostics_toggle_button)
         self.ui.export_last_button.clicked.connect(self._on_export_last_button)
         self.ui.history_button.clicked.connect(self._on_history_button)
-        self.ui.cs2_ncs_field.textChanged.connect(self._on_cs2_ncs_field_change)
+        # The console output is parsed at most once per interval, instead of on every change of the text
+        self._cs2_ncs_field_change_throttler = qthrottled(self._on_cs2_ncs_field_change, 150, self, leading=False)
+        self.ui.cs2_ncs_field.textChanged.connect(self._cs2_ncs_field_change_throttler.call)
         self.ui.cs2_ncs_paste_button.clicked.connect(self._on_cs2_ncs_paste_button)
         self.ui.cs2_ncs_clear_button.clicked.connect(self._on_cs2_ncs_clear_button)
 
-        # Initialize RTT table cells
-        for row in range(3):
-            for column in range(7):
-                self.ui.rtt_table.setItem(row, column, QTableWidgetItem())
+        # Initialize RTT table
+        self._rtt_table_model = RTTTableModel(self)
+        self.ui.rtt_table.setModel(self._rtt_table_model)
 
         self._exit_requested = False
 
-        self._history_window = HistoryWindow(self, Qt.WindowType.Dialog)
-        self._history_window.setWindowModality(Qt.WindowModality.WindowModal)
+        self._export_task = None
+        self._export_name = None
+
+        self._delete_task = None
+        self._delete_progress_dialog = None
+        self._delete_success_message = None
+
+        # Created on first use, as most runs never open the history
+        self._history_window = None
+
+        # The save dialog is reused, so it opens in the last used directory without enumerating it from scratch
+        self._save_dialog = QFileDialog(self, 'Save File')
+        self._save_dialog.setAcceptMode(QFileDialog.AcceptMode.AcceptSave)
+        self._save_dialog.setNameFilter('XZ Tarball (*.tar.xz)')
+        self._save_dialog.setOption(QFileDialog.Option.DontUseCustomDirectoryIcons)
 
         self._external_server = '1.1.1.1'
         self._cs2_server = None
+        self._cs2_ncs_text = None
+        self._cs2_ncs_parse_status = 'empty'
 
         self._diagnostics = Diagnostics(
             self._external_server,
-            cb_on_stop=lambda: self._s_on_diagnostics_stop.emit(),
-            cb_on_interruption_start=lambda total_interruptions: self._s_on_interruption_start.emit(total_interruptions),
-            cb_on_interruption_end=lambda: self._s_on_interruption_end.emit(),
-            cb_on_interface_update=lambda interface: self._s_on_interface_update.emit(interface),
-            cb_on_interface_stats_update=lambda interface_stats: self._s_on_interface_stats_update.emit(interface_stats),
-            cb_on_icmp_gateway_test_start=lambda host: self._s_on_icmp_gateway_test_start.emit(host),
-            cb_on_icmp_gateway_test_update=lambda rtt_data: self._s_on_icmp_gateway_test_update.emit(rtt_data),
-            cb_on_icmp_external_test_start=lambda host: self._s_on_icmp_external_test_start.emit(host),
-            cb_on_icmp_external_test_update=lambda rtt_data: self._s_on_icmp_external_test_update.emit(rtt_data),
-            cb_on_icmp_cs2_test_start=lambda host: self._s_on_icmp_cs2_test_start.emit(host),
-            cb_on_icmp_cs2_test_update=lambda rtt_data: self._s_on_icmp_cs2_test_update.emit(rtt_data)
+            cb_on_stop=self._s_on_diagnostics_stop.emit,
+            cb_on_interruption_start=self._s_on_interruption_start.emit,
+            cb_on_interruption_end=self._s_on_interruption_end.emit,
+            cb_on_interface_update=self._s_on_interface_update.emit,
+            cb_on_interface_stats_update=self._s_on_interface_stats_update.emit,
+            cb_on_icmp_gateway_test_start=functools.partial(self._s_on_icmp_test_start.emit, 0),
+            cb_on_icmp_gateway_test_update=functools.partial(self._s_on_icmp_test_update.emit, 0),
+            cb_on_icmp_external_test_start=functools.partial(self._s_on_icmp_test_start.emit, 1),
+            cb_on_icmp_external_test_update=functools.partial(self._s_on_icmp_test_update.emit, 1),
+            cb_on_icmp_cs2_test_start=functools.partial(self._s_on_icmp_test_start.emit, 2),
+            cb_on_icmp_cs2_test_update=functools.partial(self._s_on_icmp_test_update.emit, 2)
         )
 
     def change_theme(self, theme):
@@ -135,23 +253,32 @@ def export_diagnostics(self, name, path):
             QMessageBox.critical(self, 'Error', 'Cannot export diagnostics while diagnostics are currently running.')
             return False
 
+        if self._export_task is not None:
+            QMessageBox.critical(self, 'Error', 'Cannot export diagnostics while another export is in progress.')
+            return False
+
+        if self._delete_task is not None:
+            QMessageBox.critical(self, 'Error', 'Cannot export diagnostics while a deletion is in progress.')
+            return False
+
         tar_file_name = f'{name}.tar.xz'
-        save_file, _ = QFileDialog.getSaveFileName(self, 'Save File', tar_file_name)
-        if not save_file:
+        self._save_dialog.selectFile(tar_file_name)
+        if self._save_dialog.exec() != QFileDialog.DialogCode.Accepted:
             return False
+        save_file = self._save_dialog.selectedFiles()[0]
 
         log.debug(f"Exporting diagnostics '{name}' to '{save_file}'")
 
-        try:
-            with tarfile.open(save_file, 'w:xz', format=tarfile.PAX_FORMAT) as tar_file:
-                tar_file.add(path, name)
-        except Exception as e:
-            log.debug(f"Error creating TAR file for diagnostics '{name}'", exc_info=True)
-            log.error(f"Failed to export diagnostics '{name}': {e}")
-            QMessageBox.critical(self, 'Error', f"Failed to export diagnostics '{name}': {e}")
-            return False
+        # Compressing the archive takes a while, so it is done on a worker thread to keep the window responsive
+        self._export_task = _ExportTask(name, path, save_file)
+        self._export_task.signals.finished.connect(self._on_export_finish)
+        self._export_name = name
 
-        log.info(f"Successfully exported diagnostics '{name}'")
+        self.ui.diagnostics_toggle_button.setEnabled(False)
+        self.ui.export_last_button.setEnabled(False)
+        self.ui.statusbar.showMessage(f"Exporting diagnostics '{name}'...")
+
+        QThreadPool.globalInstance().start(self._export_task)
         return True
 
     def browse_diagnostics(self, path):
@@ -165,7 +292,7 @@ def browse_diagnostics(self, path):
     def browse_all_diagnostics(self):
         diagnostics_dir = get_diagnostics_dir()
         try:
-            open_path_in_explorer(str(diagnostics_dir))
+            open_path_in_explorer(diagnostics_dir)
         except OSError as e:
             log.debug('Error opening all diagnostics directory in explorer', exc_info=True)
             log.error(f'Failed to open all diagnostics directory in explorer: {e}')
@@ -180,17 +307,7 @@ def delete_diagnostics(self, name, path):
         if result != QMessageBox.StandardButton.Yes:
             return False
 
-        try:
-            log.debug(f"Deleting diagnostics directory '{path}'")
-            shutil.rmtree(str(path))
-        except OSError as e:
-            log.debug(f"Error deleting diagnostics directory '{path}'", exc_info=True)
-            log.error(f"Failed to delete diagnostics directory '{path}': {e}")
-            QMessageBox.critical(self, 'Error', f"Failed to delete diagnostics directory '{path}': {e}")
-            return False
-
-        log.info(f"Successfully deleted diagnostics '{name}'")
-        return True
+        return self._delete_diagnostics_async([(name, path)], f"Successfully deleted diagnostics '{name}'")
 
     def delete_all_diagnostics(self):
         if self._diagnostics.running:
@@ -201,22 +318,111 @@ def delete_all_diagnostics(self):
         if result != QMessageBox.StandardButton.Yes:
             return False
 
+        try:
+            diagnostics_history = self._diagnostics.get_diagnostics_history()
+        except Exception as e:
+            log.debug('Failed to get diagnostics history', exc_info=True)
+            log.error(f'Failed to get diagnostics history: {e}')
+            QMessageBox.critical(self, 'Error', f'Failed to get diagnostics history: {e}')
+            return False
+
         log.debug('Deleting all diagnostics')
-        for name, path in self._diagnostics.get_diagnostics_history():
-            try:
-                log.debug(f"Deleting diagnostics directory '{path}'")
-                shutil.rmtree(str(path))
-            except OSError as e:
-                log.debug(f"Error deleting diagnostics directory '{path}'", exc_info=True)
-                log.error(f"Failed to delete diagnostics directory '{path}': {e}")
-                QMessageBox.critical(self, 'Error', f"Failed to delete diagnostics directory '{path}': {e}")
-                return False
+        return self._delete_diagnostics_async(diagnostics_history, 'Successfully deleted all diagnostics')
+
+    def _delete_diagnostics_async(self, items, success_message):
+        if self._delete_task is not None:
+            QMessageBox.critical(self, 'Error', 'Cannot delete diagnostics while another deletion is in progress.')
+            return False
+
+        if self._export_task is not None:
+            QMessageBox.critical(self, 'Error', 'Cannot delete diagnostics while an export is in progress.')
+            return False
+
+        # Deleting many log files takes a while, so it is done on a worker thread, showing the progress meanwhile
+        progress_dialog = QProgressDialog('Deleting diagnostics...', None, 0, len(items), self)
+        progress_dialog.setWindowTitle('Delete')
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+        progress_dialog.setValue(0)
+
+        self._delete_task = _DeleteTask(items)
+        self._delete_task.signals.progress.connect(progress_dialog.setValue)
+        self._delete_task.signals.finished.connect(self._on_delete_finish)
+        self._delete_progress_dialog = progress_dialog
+        self._delete_success_message = success_message
+
+        self.ui.diagnostics_toggle_button.setEnabled(False)
 
-        log.info('Successfully deleted all diagnostics')
+        QThreadPool.globalInstance().start(self._delete_task)
         return True
 
+    @Slot(bool, str)
+    def _on_export_finish(self, success, error):
+        name = self._export_name
+        self._export_task = None
+        self._export_name = None
+
+        self.ui.diagnostics_toggle_button.setEnabled(self._delete_task is None)
+        self.ui.export_last_button.setEnabled(True)
+        self.ui.statusbar.clearMessage()
+
+        if not success:
+            log.error(f"Failed to export diagnostics '{name}': {error}")
+            QMessageBox.critical(self, 'Error', f"Failed to export diagnostics '{name}': {error}")
+            return
+
+        log.info(f"Successfully exported diagnostics '{name}'")
+
+    def _get_history_window(self):
+        if self._history_window is None:
+            self._history_window = HistoryWindow(self, Qt.WindowType.Dialog)
+            self._history_window.setWindowModality(Qt.WindowModality.WindowModal)
+        return self._history_window
+
+    def _reset_rtt_row(self, row):
+        self._rtt_table_model.set_row(row, ('-',) * len(RTTTableModel.COLUMN_LABELS))
+
+    @staticmethod
+    def _format_rtt(rtt):
+        return f'{rtt:.3f}' if rtt is not None else '-'
+
+    def _write_rtt_row(self, row, rtt_data):
+        texts = (
+            self._format_rtt(rtt_data.average),
+            self._format_rtt(rtt_data.minimum),
+            self._format_rtt(rtt_data.maximum),
+            self._format_rtt(rtt_data.jitter),
+            str(rtt_data.sent),
+            str(rtt_data.received),
+            f'{rtt_data.loss * 100:.1f}%'
+        )
+
+        self._rtt_table_model.set_row(row, texts)
+
+    @Slot(list, str)
+    def _on_delete_finish(self, deleted_names, error):
+        success_message = self._delete_success_message
+        self._delete_progress_dialog.reset()
+        self._delete_progress_dialog.deleteLater()
+        self._delete_task = None
+        self._delete_progress_dialog = None
+        self._delete_success_message = None
+
+        self.ui.diagnostics_toggle_button.setEnabled(self._export_task is None)
+
+        if deleted_names:
+            self.diagnostics_deleted.emit(deleted_names)
+
+        if error:
+            log.error(error)
+            QMessageBox.critical(self, 'Error', error)
+            return
+
+        log.info(success_message)
+
     # UI handlers
 
+    @Slot()
     def _on_menu_about(self):
         QMessageBox.about(
             self,
@@ -232,6 +438,7 @@ def _on_menu_about(self):
             )
         )
 
+    @Slot(bool)
     def _on_diagnostics_toggle_button(self, checked):
         if checked:
             try:
@@ -255,6 +462,7 @@ def _on_diagnostics_toggle_button(self, checked):
             self.setEnabled(False)
             self.ui.statusbar.showMessage('Stopping diagnostics...')
 
+    @Slot()
     def _on_export_last_button(self):
         try:
             diagnostics_history = self._diagnostics.get_diagnostics_history()
@@ -271,6 +479,7 @@ def _on_export_last_button(self):
         name, path = diagnostics_history[0]
         self.export_diagnostics(name, path)
 
+    @Slot()
     def _on_history_button(self):
         try:
             diagnostics_history = self._diagnostics.get_diagnostics_history()
@@ -280,58 +489,42 @@ def _on_history_button(self):
             QMessageBox.critical(self, 'Error', f'Failed to get diagnostics history: {e}')
             return
 
+        history_window = self._get_history_window()
         try:
-            self._history_window.update_history(diagnostics_history)
+            history_window.update_history(diagnostics_history)
         except Exception as e:
             log.debug('Error updating history with diagnostics data', exc_info=True)
             log.error(f'Error updating history with diagnostics data: {e}')
             QMessageBox.critical(self, 'Error', f'Error updating history with diagnostics data: {e}')
             return
 
-        self._history_window.show()
+        history_window.show()
 
+    @Slot()
     def _on_cs2_ncs_field_change(self):
         cs2_console_output = self.ui.cs2_ncs_field.toPlainText()
+        if cs2_console_output == self._cs2_ncs_text:
+            return
+        self._cs2_ncs_text = cs2_console_output
 
         if not cs2_console_output.strip():
             self._cs2_server = None
-
-            # Reset console parse status
-            self.ui.cs2_ncs_parse_value_label.setText('Waiting for input...')
-            self.ui.cs2_ncs_parse_value_label.setStyleSheet('')
-
-            # Reset connection status values
-            self.ui.cs2_ncs_game_server_value_label.setText('-')
-            self.ui.cs2_ncs_primary_relay_value_label.setText('-')
-            self.ui.cs2_ncs_backup_relay_value_label.setText('-')
-
+            self._set_cs2_ncs_parse_status('empty')
             self._diagnostics.set_icmp_cs2_test_server(self._cs2_server)
 
             return
 
         try:
             cs2_ncs = parse_cs2_ncs(cs2_console_output)
-        except ValueError as e:
+        except ValueError:
             self._cs2_server = None
-
-            # Set console parse status to error
-            self.ui.cs2_ncs_parse_value_label.setText('Incorrect or incomplete CS2 console output. Please try again.')
-            self.ui.cs2_ncs_parse_value_label.setStyleSheet('QLabel { color: #ff4040; }')
-
-            # Reset connection status values
-            self.ui.cs2_ncs_game_server_value_label.setText('-')
-            self.ui.cs2_ncs_primary_relay_value_label.setText('-')
-            self.ui.cs2_ncs_backup_relay_value_label.setText('-')
-
+            self._set_cs2_ncs_parse_status('error')
             self._diagnostics.set_icmp_cs2_test_server(self._cs2_server)
 
             return
 
         self._cs2_server = cs2_ncs['primary_relay_address']
-
-        # Set console parse status to success
-        self.ui.cs2_ncs_parse_value_label.setText('CS2 server connection information available.')
-        self.ui.cs2_ncs_parse_value_label.setStyleSheet('QLabel { color: #10b010; }')
+        self._set_cs2_ncs_parse_status('success')
 
         # Populate connection status values
 
@@ -359,11 +552,29 @@ def _on_cs2_ncs_field_change(self):
 
         self._diagnostics.set_icmp_cs2_test_server(self._cs2_server)
 
+    def _set_cs2_ncs_parse_status(self, status):
+        # The labels are only changed on status transitions, to avoid reapplying the same text and style sheet
+        previous_status = self._cs2_ncs_parse_status
+        if status == previous_status:
+            return
+        self._cs2_ncs_parse_status = status
+
+        text, style_sheet = MainWindow.CS2_NCS_PARSE_STATUSES[status]
+        self.ui.cs2_ncs_parse_value_label.setText(text)
+        self.ui.cs2_ncs_parse_value_label.setStyleSheet(style_sheet)
+
+        # Reset connection status values, which are only available after successful parsing
+        if previous_status == 'success':
+            self.ui.cs2_ncs_game_server_value_label.setText('-')
+            self.ui.cs2_ncs_primary_relay_value_label.setText('-')
+            self.ui.cs2_ncs_backup_relay_value_label.setText('-')
+
+    @Slot()
     def _on_cs2_ncs_paste_button(self):
-        clipboard = QClipboard(self)
-        clipboard_text = clipboard.text()
+        clipboard_text = QGuiApplication.clipboard().text()
         self.ui.cs2_ncs_field.setPlainText(clipboard_text)
 
+    @Slot()
     def _on_cs2_ncs_clear_button(self):
         self.ui.cs2_ncs_field.setPlainText('')
 
@@ -392,6 +603,7 @@ def closeEvent(self, event):  # noqa: N802
 
     # Diagnostics handlers
 
+    @Slot()
     def _on_diagnostics_stop(self):
         if self._exit_requested:
             self.close()
@@ -400,7 +612,7 @@ def _on_diagnostics_stop(self):
         self.setEnabled(True)
 
         self.ui.diagnostics_toggle_button.setText('Start')
-        self.ui.export_last_button.setEnabled(True)
+        self.ui.export_last_button.setEnabled(self._export_task is None)
         self.ui.history_button.setEnabled(True)
 
         self.ui.active_interface_value_label.setText('-')
@@ -411,16 +623,20 @@ def _on_diagnostics_stop(self):
 
         self.ui.statusbar.clearMessage()
 
+    @Slot(int)
     def _on_interruption_start(self, total_interruptions):
         self.ui.internet_connectivity_label.setText('Unstable')
         self.ui.interruptions_value_label.setText(str(total_interruptions))
 
+    @Slot()
     def _on_interruption_end(self):
         self.ui.internet_connectivity_label.setText('Stable')
 
+    @Slot(NetworkInterface)
     def _on_interface_update(self, interface):
         self.ui.active_interface_value_label.setText(interface.name)
 
+    @Slot(dict)
     def _on_interface_stats_update(self, interface_stats):
         status = 'Up' if interface_stats['up'] else 'Down'
         self.ui.link_status_value_label.setText(status)
@@ -431,56 +647,12 @@ def _on_interface_stats_update(self, interface_stats):
 
         self.ui.internet_connectivity_value_label.setText('Stable')
 
-    def _on_icmp_gateway_test_start(self, host):
-        self.ui.rtt_table.item(0, 0).setText('-')
-        self.ui.rtt_table.item(0, 1).setText('-')
-        self.ui.rtt_table.item(0, 2).setText('-')
-        self.ui.rtt_table.item(0, 3).setText('-')
-        self.ui.rtt_table.item(0, 4).setText('-')
-        self.ui.rtt_table.item(0, 5).setText('-')
-        self.ui.rtt_table.item(0, 6).setText('-')
-
-    def _on_icmp_gateway_test_update(self, rtt_data):
-        self.ui.rtt_table.item(0, 0).setText(f'{rtt_data.average:.3f}' if rtt_data.average is not None else '-')
-        self.ui.rtt_table.item(0, 1).setText(f'{rtt_data.minimum:.3f}' if rtt_data.minimum is not None else '-')
-        self.ui.rtt_table.item(0, 2).setText(f'{rtt_data.maximum:.3f}' if rtt_data.maximum is not None else '-')
-        self.ui.rtt_table.item(0, 3).setText(f'{rtt_data.jitter:.3f}' if rtt_data.jitter is not None else '-')
-        self.ui.rtt_table.item(0, 4).setText(f'{rtt_data.sent}')
-        self.ui.rtt_table.item(0, 5).setText(f'{rtt_data.received}')
-        self.ui.rtt_table.item(0, 6).setText(f'{rtt_data.loss * 100:.1f}%')
-
-    def _on_icmp_external_test_start(self, host):
-        self.ui.rtt_table.item(1, 0).setText('-')
-        self.ui.rtt_table.item(1, 1).setText('-')
-        self.ui.rtt_table.item(1, 2).setText('-')
-        self.ui.rtt_table.item(1, 3).setText('-')
-        self.ui.rtt_table.item(1, 4).setText('-')
-        self.ui.rtt_table.item(1, 5).setText('-')
-        self.ui.rtt_table.item(1, 6).setText('-')
-
-    def _on_icmp_external_test_update(self, rtt_data):
-        self.ui.rtt_table.item(1, 0).setText(f'{rtt_data.average:.3f}' if rtt_data.average is not None else '-')
-        self.ui.rtt_table.item(1, 1).setText(f'{rtt_data.minimum:.3f}' if rtt_data.minimum is not None else '-')
-        self.ui.rtt_table.item(1, 2).setText(f'{rtt_data.maximum:.3f}' if rtt_data.maximum is not None else '-')
-        self.ui.rtt_table.item(1, 3).setText(f'{rtt_data.jitter:.3f}' if rtt_data.jitter is not None else '-')
-        self.ui.rtt_table.item(1, 4).setText(f'{rtt_data.sent}')
-        self.ui.rtt_table.item(1, 5).setText(f'{rtt_data.received}')
-        self.ui.rtt_table.item(1, 6).setText(f'{rtt_data.loss * 100:.1f}%')
-
-    def _on_icmp_cs2_test_start(self, host):
-        self.ui.rtt_table.item(2, 0).setText('-')
-        self.ui.rtt_table.item(2, 1).setText('-')
-        self.ui.rtt_table.item(2, 2).setText('-')
-        self.ui.rtt_table.item(2, 3).setText('-')
-        self.ui.rtt_table.item(2, 4).setText('-')
-        self.ui.rtt_table.item(2, 5).setText('-')
-        self.ui.rtt_table.item(2, 6).setText('-')
-
-    def _on_icmp_cs2_test_update(self, rtt_data):
-        self.ui.rtt_table.item(2, 0).setText(f'{rtt_data.average:.3f}' if rtt_data.average is not None else '-')
-        self.ui.rtt_table.item(2, 1).setText(f'{rtt_data.minimum:.3f}' if rtt_data.minimum is not None else '-')
-        self.ui.rtt_table.item(2, 2).setText(f'{rtt_data.maximum:.3f}' if rtt_data.maximum is not None else '-')
-        self.ui.rtt_table.item(2, 3).setText(f'{rtt_data.jitter:.3f}' if rtt_data.jitter is not None else '-')
-        self.ui.rtt_table.item(2, 4).setText(f'{rtt_data.sent}')
-        self.ui.rtt_table.item(2, 5).setText(f'{rtt_data.received}')
-        self.ui.rtt_table.item(2, 6).setText(f'{rtt_data.loss * 100:.1f}%')
+    @Slot(int, str)
+    def _on_icmp_test_start(self, row, host):
+        # Discard the data of the previous test, if it hasn't been shown yet
+        self._rtt_row_throttlers[row].cancel()
+        self._reset_rtt_row(row)
+
+    @Slot(int, RTTData)
+    def _on_icmp_test_update(self, row, rtt_data):
+        self._rtt_row_throttlers[row].call(rtt_data)
@@ -0,0 +1,38 @@
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+
+class RTTTableModel(QAbstractTableModel):
+
+    ROW_LABELS = ('Gateway', 'External', 'CS2 (N/A)')
+    COLUMN_LABELS = ('Avg', 'Min', 'Max', 'Jitter', 'Sent', 'Recv', 'Loss %')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Cells are stored already formatted, as the view reads them far more often than they change
+        self._rows = [('',) * len(self.COLUMN_LABELS) for _ in self.ROW_LABELS]
+
+    def rowCount(self, parent=QModelIndex()):  # noqa: N802
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):  # noqa: N802
+        return 0 if parent.isValid() else len(self.COLUMN_LABELS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self._rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):  # noqa: N802
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.COLUMN_LABELS[section]
+        return self.ROW_LABELS[section]
+
+    def set_row(self, row, texts):
+        self._rows[row] = tuple(texts)
+        self.dataChanged.emit(
+            self.index(row, 0),
+            self.index(row, len(self.COLUMN_LABELS) - 1),
+            (Qt.ItemDataRole.DisplayRole,)
+        )
@@ -0,0 +1,42 @@
+from PySide6.QtCore import QObject, QTimer
+
+
+class Throttler(QObject):
+
+    def __init__(self, func, timeout, leading=True, parent=None):
+        super().__init__(parent)
+        self._func = func
+        self._leading = leading
+        self._pending_args = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(timeout)
+        self._timer.timeout.connect(self._on_timeout)
+
+    def call(self, *args):
+        if self._timer.isActive() or not self._leading:
+            # Only the latest arguments are kept and passed when the interval ends
+            self._pending_args = args
+            if not self._timer.isActive():
+                self._timer.start()
+            return
+
+        self._func(*args)
+        self._timer.start()
+
+    def cancel(self):
+        self._pending_args = None
+
+    def _on_timeout(self):
+        if self._pending_args is None:
+            return
+
+        args = self._pending_args
+        self._pending_args = None
+        self._func(*args)
+        self._timer.start()
+
+
+def qthrottled(func, timeout=100, parent=None, leading=True):
+    return Throttler(func, timeout, leading, parent)
@@ -2,8 +2,7 @@
 import logging
 import logging.config
 import logging.handlers
-import queue
-import copy
+import time
 
 import datetime
 
@@ -12,57 +11,73 @@ class DatetimeFormatter(logging.Formatter):
 
     converter = datetime.datetime.fromtimestamp
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Second, date format and the formatted parts around the microseconds, which change only once per second
+        self._time_parts = None
+
     def formatTime(self, record, datefmt=None):  # noqa: N802
-        converter = self.converter(record.created).astimezone()
-        if datefmt:
-            ts = converter.strftime(datefmt)
-        else:
-            t = converter.strftime('%Y-%m-%dT%H:%M:%S')
-            ts = f'{t}.{int(record.msecs):03d}'
-        return ts
-
-
-_logging_config = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            '()': DatetimeFormatter,
-            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
-            'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z'
-        }
-    },
-    'handlers': {
-        'stderr': {
-            'class': 'logging.StreamHandler',
-            'level': 'DEBUG',
-            'formatter': 'verbose',
-            'stream': 'ext://sys.stderr'
+        if not datefmt:
+            t = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+            return f'{t}.{int(record.msecs):03d}'
+
+        seconds = int(record.created)
+        microseconds = round((record.created - seconds) * 1e6)
+        if '%f' not in datefmt or microseconds >= 1_000_000:
+            return self.converter(record.created).astimezone().strftime(datefmt)
+
+        time_parts = self._time_parts
+        if time_parts is None or time_parts[0] != seconds or time_parts[1] != datefmt:
+            dt = self.converter(seconds).astimezone()
+            prefix, suffix = datefmt.split('%f', 1)
+            time_parts = (seconds, datefmt, dt.strftime(prefix), dt.strftime(suffix))
+            self._time_parts = time_parts
+
+        return f'{time_parts[2]}{microseconds:06d}{time_parts[3]}'
+
+
+def _make_logging_config(logs_dir):
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'verbose': {
+                '()': DatetimeFormatter,
+                'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+                'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z'
+            }
         },
-        'file': {
-            'class': 'logging.handlers.RotatingFileHandler',
-            'level': 'DEBUG',
-            'formatter': 'verbose',
-            'filename': '{}/log.log',
-            'maxBytes': 1024 * 1024,  # 1 MiB
-            'backupCount': 2
+        'handlers': {
+            'stderr': {
+                'class': 'logging.StreamHandler',
+                'level': 'DEBUG',
+                'formatter': 'verbose',
+                'stream': 'ext://sys.stderr'
+            },
+            'file': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'level': 'DEBUG',
+                'formatter': 'verbose',
+                'filename': f'{logs_dir}/log.log',
+                'maxBytes': 1024 * 1024,  # 1 MiB
+                'backupCount': 2
+            },
+            'queue_handler': {
+                'class': 'logging.handlers.QueueHandler',
+                'handlers': [
+                    'stderr',
+                    'file'
+                ],
+                'respect_handler_level': True
+            }
         },
-        'queue_handler': {
-            'class': 'logging.handlers.QueueHandler',
+        'root': {
+            'level': 'DEBUG',
             'handlers': [
-                'stderr',
-                'file'
-            ],
-            'respect_handler_level': True
+                'queue_handler'
+            ]
         }
-    },
-    'root': {
-        'level': 'DEBUG',
-        'handlers': [
-            'queue_handler'
-        ]
     }
-}
 
 
 def setup_logging(logs_dir):
@@ -70,13 +85,7 @@ def setup_logging(logs_dir):
     logging.getLogger('requests').propagate = False
     logging.getLogger('urllib3').propagate = False
 
-    config = copy.deepcopy(_logging_config)
-    for handler in config.get('handlers', {}).values():
-        for key, value in handler.items():
-            if key == 'filename':
-                handler[key] = value.format(logs_dir)
-
-    logging.config.dictConfig(config)
+    logging.config.dictConfig(_make_logging_config(logs_dir))
 
     queue_handler = logging.getHandlerByName('queue_handler')
     if queue_handler is not None:
@@ -84,52 +93,68 @@ def setup_logging(logs_dir):
         atexit.register(queue_handler.listener.stop)
 
 
-_diagnostics_handlers = {
-    'root': {
-        'level': 'DEBUG',
-        'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
-        'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
-        'filename': '{}/general.log'
-    },
-    'icmp': {
-        'level': 'DEBUG',
-        'format': '%(asctime)s %(levelname)s: %(message)s',
-        'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
-        'filename': '{}/icmp.log'
-    },
-    'tests': {
-        'level': 'DEBUG',
-        'format': '%(asctime)s %(levelname)s: %(message)s',
-        'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
-        'filename': '{}/tests.log'
-    },
-    'event-log': {
-        'level': 'DEBUG',
-        'format': '%(asctime)s %(levelname)s: %(message)s',
-        'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
-        'filename': '{}/event-log.log'
+def add_logging_handler(handler):
+    queue_handler = logging.getHandlerByName('queue_handler')
+    if queue_handler is None:
+        logging.getLogger().addHandler(handler)
+        return
+
+    # Handlers of the queue listener format and handle the records on its thread,
+    # instead of on the thread that logged them
+    listener = queue_handler.listener
+    listener.handlers = (*listener.handlers, handler)
+
+
+def _make_diagnostics_handlers(diagnostics_logs_dir):
+    return {
+        'root': {
+            'level': 'DEBUG',
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+            'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
+            'filename': f'{diagnostics_logs_dir}/general.log'
+        },
+        'icmp': {
+            'level': 'DEBUG',
+            'format': '%(asctime)s %(levelname)s: %(message)s',
+            'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
+            'filename': f'{diagnostics_logs_dir}/icmp.log'
+        },
+        'tests': {
+            'level': 'DEBUG',
+            'format': '%(asctime)s %(levelname)s: %(message)s',
+            'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
+            'filename': f'{diagnostics_logs_dir}/tests.log'
+        },
+        'event-log': {
+            'level': 'DEBUG',
+            'format': '%(asctime)s %(levelname)s: %(message)s',
+            'datefmt': '%Y-%m-%dT%H:%M:%S.%f%z',
+            'filename': f'{diagnostics_logs_dir}/event-log.log'
+        }
     }
-}
+
+
+def _mark_diagnostics_only(record):
+    record.diagnostics_only = True
+    return True
+
+
+def _exclude_diagnostics_only(record):
+    return not getattr(record, 'diagnostics_only', False)
 
 
 def setup_diagnostics_logging(diagnostics_logs_dir):
-    handlers = copy.deepcopy(_diagnostics_handlers)
-    for handler in handlers.values():
-        for key, value in handler.items():
-            if key == 'filename':
-                handler[key] = value.format(diagnostics_logs_dir)
+    handlers = _make_diagnostics_handlers(diagnostics_logs_dir)
 
     queue_listener = None
     queue_handler = None
-
-    root_logger = logging.getLogger()
+    diagnostics_handlers = []
 
     def start():
         nonlocal queue_listener
         nonlocal queue_handler
 
         level_names_mapping = logging.getLevelNamesMapping()
-        diagnostics_handlers = []
 
         for name, config in handlers.items():
             handler = logging.FileHandler(config['filename'], encoding='utf-8')
@@ -150,34 +175,46 @@ def start():
 
             diagnostics_handlers.append(handler)
 
-        # Create and configure the diagnostics queue listener and queue handler
-        queue_ = queue.Queue()
-        queue_listener = logging.handlers.QueueListener(queue_, *diagnostics_handlers, respect_handler_level=True)
-        queue_handler = logging.handlers.QueueHandler(queue_)
+        # The diagnostics handlers are served by the application queue listener, instead of a listener of their own.
+        # Records for all loggers already reach it through the application queue handler on the root logger
+        app_queue_handler = logging.getHandlerByName('queue_handler')
+        queue_listener = app_queue_handler.listener
+
+        # Records of the non-propagating diagnostics loggers are queued to the same listener, but marked,
+        # so that they are written only to the diagnostics files and not sent to the application handlers
+        queue_handler = logging.handlers.QueueHandler(app_queue_handler.queue)
         queue_handler.set_name('diagnostics_queue_handler')
+        queue_handler.addFilter(_mark_diagnostics_only)
 
-        # Add the diagnostics queue handler to the root logger to allow handling records for all loggers
-        root_logger.addHandler(queue_handler)
+        # Restart the listener to handle all records queued so far, before adding the diagnostics handlers
+        queue_listener.stop()
+        for handler in queue_listener.handlers:
+            handler.addFilter(_exclude_diagnostics_only)
+        queue_listener.handlers = (*queue_listener.handlers, *diagnostics_handlers)
+        queue_listener.start()
 
-        # Add the diagnostics queue handler to each non-propagating diagnostics logger individually
-        # to allow diagnostics-only log records to be written to files without being sent to other handlers
         for name in handlers.keys():
-            current_logger = logging.getLogger(name)
-            current_logger.addHandler(queue_handler)
-
-        queue_listener.start()
+            if name != 'root':
+                logging.getLogger(name).addHandler(queue_handler)
 
     def stop():
-        root_logger.removeHandler(queue_handler)
         for name in handlers.keys():
-            current_logger = logging.getLogger(name)
-            current_logger.removeHandler(queue_handler)
+            if name != 'root':
+                logging.getLogger(name).removeHandler(queue_handler)
 
+        # Restart the listener to handle all records queued so far, before removing the diagnostics handlers
         queue_listener.stop()
+        queue_listener.handlers = tuple(
+            handler for handler in queue_listener.handlers
+            if handler not in diagnostics_handlers
+        )
+        for handler in queue_listener.handlers:
+            handler.removeFilter(_exclude_diagnostics_only)
+        queue_listener.start()
 
         # Close the diagnostics handlers to flush the buffers and allow reading the files
         queue_handler.close()
-        for handler in queue_listener.handlers:
+        for handler in diagnostics_handlers:
             handler.close()
 
     return start, stop
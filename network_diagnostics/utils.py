@@ -1,36 +1,109 @@
+import contextlib
 import ctypes
+import functools
+import ipaddress
+import os
 import re
 import subprocess
-import tempfile
-from pathlib import Path
+import threading
+import time
+import traceback
 
-import filelock
 import platformdirs
+import pythoncom
+import pywintypes
+import win32api
+import win32com.client
+import win32event
+import winerror
 
 
-def _check_firewall_icmp_rule():
+_FIREWALL_RULE_NAME = 'Network Diagnostics - Allow ICMPv4 Time Exceeded'
+
+
+@contextlib.contextmanager
+def _com_initialized():
+    # Fails if the thread is already initialized with a different concurrency model, which is still usable
+    try:
+        pythoncom.CoInitialize()
+    except pywintypes.com_error:
+        yield
+        return
+    try:
+        yield
+    finally:
+        pythoncom.CoUninitialize()
+
+
+def _get_firewall_policy():
+    try:
+        return win32com.client.Dispatch('HNetCfg.FwPolicy2')
+    except pywintypes.com_error:
+        return None
+
+
+def _check_firewall_icmp_rule_com(policy):
+    try:
+        policy.Rules.Item(_FIREWALL_RULE_NAME)
+        return True
+    except pywintypes.com_error:
+        return False
+
+
+def _create_firewall_rules_com(policy):
+    if _check_firewall_icmp_rule_cached(functools.partial(_check_firewall_icmp_rule_com, policy)):
+        return
+
+    try:
+        rule = win32com.client.Dispatch('HNetCfg.FWRule')
+        rule.Name = _FIREWALL_RULE_NAME
+        rule.Protocol = 1  # ICMPv4
+        rule.IcmpTypesAndCodes = '11:*'
+        rule.Direction = 1  # Inbound
+        rule.Action = 1  # Allow
+        rule.Enabled = True
+        policy.Rules.Add(rule)
+    except pywintypes.com_error as e:
+        raise OSError(f'Failed to create firewall rule: {e.strerror}') from e
+
+
+def _remove_firewall_rules_com(policy):
+    try:
+        policy.Rules.Remove(_FIREWALL_RULE_NAME)
+    except pywintypes.com_error as e:
+        raise OSError(f'Failed to remove firewall rule: {e.strerror}') from e
+
+
+# The output is only needed for errors, so it's kept as bytes and decoded from the console code page on demand
+def _decode_netsh_output(output):
+    return output.decode('oem', errors='replace').strip()
+
+
+def _check_firewall_icmp_rule_netsh():
     args = (
         'C:\\Windows\\System32\\netsh.exe',
         'advfirewall',
         'firewall',
         'show',
         'rule',
-        'name=Network Diagnostics - Allow ICMPv4 Time Exceeded'
+        f'name={_FIREWALL_RULE_NAME}'
     )
+    # Only the exit code is needed, so the rule listing isn't captured
     try:
-        subprocess.check_output(
+        result = subprocess.run(
             args=args,
-            stderr=subprocess.STDOUT,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
             timeout=10
         )
-        return True
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
+        return result.returncode == 0
+    except subprocess.TimeoutExpired:
         return False
 
 
-def create_firewall_rules():
-    if _check_firewall_icmp_rule():
+def _create_firewall_rules_netsh():
+    # Adding a rule doesn't fail if one with the same name exists, it creates a duplicate instead
+    if _check_firewall_icmp_rule_cached(_check_firewall_icmp_rule_netsh):
         return
 
     args = (
@@ -39,7 +112,7 @@ def create_firewall_rules():
         'firewall',
         'add',
         'rule',
-        'name=Network Diagnostics - Allow ICMPv4 Time Exceeded',
+        f'name={_FIREWALL_RULE_NAME}',
         'dir=in',
         'action=allow',
         'protocol=icmpv4:11,any'
@@ -48,36 +121,117 @@ def create_firewall_rules():
         subprocess.check_output(
             args=args,
             stderr=subprocess.STDOUT,
-            text=True,
             timeout=10
         )
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
-        raise OSError(f"Failed to create firewall rule. Exit code: {e.returncode}, Output: '{e.output.strip()}'") from e
+    except subprocess.CalledProcessError as e:
+        raise OSError(f"Failed to create firewall rule. Exit code: {e.returncode}, Output: '{_decode_netsh_output(e.output)}'") from e
+    except subprocess.TimeoutExpired as e:
+        raise OSError(f'Failed to create firewall rule. Timed out after {e.timeout} seconds') from e
 
 
-def remove_firewall_rules():
-    if not _check_firewall_icmp_rule():
-        return
-
+def _remove_firewall_rules_netsh():
     args = (
         'C:\\Windows\\System32\\netsh.exe',
         'advfirewall',
         'firewall',
         'delete',
         'rule',
-        'name=Network Diagnostics - Allow ICMPv4 Time Exceeded'
+        f'name={_FIREWALL_RULE_NAME}'
     )
     try:
         subprocess.check_output(
             args=args,
             stderr=subprocess.STDOUT,
-            text=True,
             timeout=10
         )
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
-        raise OSError(f"Failed to remove firewall rule. Exit code: {e.returncode}, Output: '{e.output.strip()}'") from e
+    except subprocess.CalledProcessError as e:
+        # Deleting fails when no rule matches, so whether the rule exists is checked only in that case
+        if not _check_firewall_icmp_rule_netsh():
+            return
+        raise OSError(f"Failed to remove firewall rule. Exit code: {e.returncode}, Output: '{_decode_netsh_output(e.output)}'") from e
+    except subprocess.TimeoutExpired as e:
+        raise OSError(f'Failed to remove firewall rule. Timed out after {e.timeout} seconds') from e
+
+
+_FIREWALL_RULE_CHECK_TTL = 2
+_firewall_rule_check_lock = threading.Lock()
+_firewall_rule_check = None
+
+
+def _check_firewall_icmp_rule_cached(check):
+    global _firewall_rule_check
+
+    # Back to back checks reuse the last result for a short time
+    with _firewall_rule_check_lock:
+        if _firewall_rule_check is not None:
+            checked_at, exists = _firewall_rule_check
+            if time.monotonic() - checked_at < _FIREWALL_RULE_CHECK_TTL:
+                return exists
+        exists = check()
+        _firewall_rule_check = (time.monotonic(), exists)
+        return exists
+
+
+def _invalidate_firewall_rule_check():
+    global _firewall_rule_check
+
+    with _firewall_rule_check_lock:
+        _firewall_rule_check = None
+
+
+def _run_with_firewall_policy(function):
+    # Every COM object has to be released before COM is uninitialized on the thread, including the ones referenced
+    # by the frames of an error's traceback. Returns whether the policy was available
+    with _com_initialized():
+        policy = _get_firewall_policy()
+        if policy is None:
+            return False
+        try:
+            function(policy)
+        except Exception as e:
+            traceback.clear_frames(e.__traceback__)
+            if e.__cause__ is not None:
+                traceback.clear_frames(e.__cause__.__traceback__)
+            raise
+        finally:
+            del policy
+    return True
+
+
+# The rules are managed through the firewall COM API in-process, netsh is only used if it's unavailable
+def create_firewall_rules():
+    try:
+        if not _run_with_firewall_policy(_create_firewall_rules_com):
+            _create_firewall_rules_netsh()
+    finally:
+        _invalidate_firewall_rule_check()
+
+
+def remove_firewall_rules():
+    try:
+        if not _run_with_firewall_policy(_remove_firewall_rules_com):
+            _remove_firewall_rules_netsh()
+    finally:
+        _invalidate_firewall_rule_check()
+
+
+_firewall_rules_lock = threading.Lock()
+_firewall_rules_created = False
+
 
+def ensure_firewall_rules():
+    global _firewall_rules_created
 
+    # Only the first call in the process creates the rules, returns whether it was this call
+    with _firewall_rules_lock:
+        if _firewall_rules_created:
+            return False
+        create_firewall_rules()
+        _firewall_rules_created = True
+        return True
+
+
+@functools.cache
 def is_running_as_admin():
     try:
         return ctypes.windll.shell32.IsUserAnAdmin() == 1
@@ -85,18 +239,17 @@ def is_running_as_admin():
         return False
 
 
-_data_path = platformdirs.user_data_path('network-diagnostics', False)
-_logs_path = _data_path / 'logs'
-_diagnostics_path = _data_path / 'diagnostics'
+_data_path = platformdirs.user_data_dir('network-diagnostics', False)
+_logs_path = os.path.join(_data_path, 'logs')
+_diagnostics_path = os.path.join(_data_path, 'diagnostics')
 
 
 def create_app_dirs():
     try:
-        _data_path.mkdir(parents=True, exist_ok=True)
-        _logs_path.mkdir(parents=True, exist_ok=True)
-        _diagnostics_path.mkdir(parents=True, exist_ok=True)
+        os.makedirs(_logs_path, exist_ok=True)
+        os.makedirs(_diagnostics_path, exist_ok=True)
     except OSError as e:
-        raise OSError(e.errno, 'Failed to create application directory', str(_data_path)) from e
+        raise OSError(e.errno, 'Failed to create application directory', _data_path) from e
 
 
 def get_data_dir():
@@ -111,45 +264,118 @@ def get_diagnostics_dir():
     return _diagnostics_path
 
 
-def get_file_lock():
-    temp_dir = Path(tempfile.gettempdir())
-    lock_file = temp_dir / 'network-diagnostics.lock'
-    lock = filelock.FileLock(lock_file, blocking=False)
-    return lock
+_INSTANCE_LOCK_NAME = 'Local\\network-diagnostics'
+
+
+class InstanceLock:
+
+    def __init__(self, name):
+        self._name = name
+        self._handle = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError('Another instance is already running')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    # Returns whether the lock was acquired, the mutex is released by the system when the process exits
+    def acquire(self):
+        if self._handle is not None:
+            return True
+        handle = win32event.CreateMutex(None, True, self._name)
+        if win32api.GetLastError() == winerror.ERROR_ALREADY_EXISTS:
+            handle.Close()
+            return False
+        self._handle = handle
+        return True
+
+    def release(self):
+        if self._handle is None:
+            return
+        win32event.ReleaseMutex(self._handle)
+        self._handle.Close()
+        self._handle = None
+
+
+def get_instance_lock():
+    return InstanceLock(_INSTANCE_LOCK_NAME)
+
+
+# Matches any of the CS2 console output lines needed, so that the text is scanned only once.
+# Whitespace doesn't span lines and repetitions are possessive, so non-matching lines are rejected without backtracking
+# Compiled on first use, as most sessions never parse any console output
+@functools.cache
+def _get_re_cs2_ncs():
+    return re.compile(
+        r"^\[Networking\][ \t]++(?:"
+        r"(?P<server>Remote host is in data center '(?P<server_location>[A-Za-z0-9_]++)')"
+        r"|(?P<primary_relay>Primary router: (?P<pr_location>[A-Za-z0-9_]++#\d++) \((?P<pr_host>[^:()\s]++):(?P<pr_port>\d++)\)[ \t]++Ping = (?P<pr_latency_front>-?\d++)\+(?P<pr_latency_back>-?\d++)=-?\d++ \(front\+back=total\))"
+        r"|(?P<backup_relay>Backup router: (?P<br_location>[A-Za-z0-9_]++#\d++) \((?P<br_host>[^:()\s]++):(?P<br_port>\d++)\)[ \t]++Ping = (?P<br_latency_front>-?\d++)\+(?P<br_latency_back>-?\d++)=-?\d++ \(front\+back=total\))"
+        r")$",
+        re.MULTILINE
+    )
+
+
+def _iter_cs2_ncs_matches(text):
+    # Only lines starting with the networking tag can match, which are found with a plain substring search,
+    # instead of trying the regex at the start of every line
+    re_cs2_ncs = _get_re_cs2_ncs()
+    position = text.find('[Networking]')
+    while position != -1:
+        line_end = text.find('\n', position)
+        if line_end == -1:
+            line_end = len(text)
+
+        if position == 0 or text[position - 1] == '\n':
+            match = re_cs2_ncs.match(text, position, line_end)
+            if match:
+                yield match
+
+        position = text.find('[Networking]', line_end)
 
 
-_re_cs2_server = re.compile(
-    r"^\[Networking\]\s+Remote host is in data center '(?P<location>\w+)'$",
-    re.MULTILINE
-)
-_re_cs2_primary_router = re.compile(
-    r"^\[Networking\]\s+Primary router: (?P<location>\w+#\d+) \((?P<host>(?:\d{1,3}\.){3}\d{1,3}):(?P<port>\d+)\)\s+Ping = (?P<latency_front>-?\d+)\+(?P<latency_back>-?\d+)=-?\d+ \(front\+back=total\)$",
-    re.MULTILINE
-)
-_re_cs2_backup_router = re.compile(
-    r"^\[Networking\]\s+Backup router: (?P<location>\w+#\d+) \((?P<host>(?:\d{1,3}\.){3}\d{1,3}):(?P<port>\d+)\)\s+Ping = (?P<latency_front>-?\d+)\+(?P<latency_back>-?\d+)=-?\d+ \(front\+back=total\)$",
-    re.MULTILINE
-)
+def _validate_cs2_relay_address(address):
+    # The address is matched loosely and validated separately, which keeps the pattern simple
+    try:
+        ipaddress.IPv4Address(address)
+    except ValueError as e:
+        raise ValueError(f"Invalid CS2 relay address '{address}'") from e
 
 
 def parse_cs2_ncs(text):
-    cs2_server_match = _re_cs2_server.search(text)
+    # Keep the first match of each line kind
+    matches = {}
+    for match in _iter_cs2_ncs_matches(text):
+        matches.setdefault(match.lastgroup, match)
+        if len(matches) == 3:
+            break
+
+    cs2_server_match = matches.get('server')
     if not cs2_server_match:
         raise ValueError('Could not find CS2 server')
 
-    server_location = cs2_server_match.groupdict()['location']
+    server_location = cs2_server_match.group('server_location')
 
-    cs2_primary_router_match = _re_cs2_primary_router.search(text)
+    cs2_primary_router_match = matches.get('primary_relay')
     if not cs2_primary_router_match:
         raise ValueError('Could not find CS2 primary relay')
 
-    pr_location, pr_address, pr_port, pr_latency_front, pr_latency_back = cs2_primary_router_match.groupdict().values()
+    pr_location, pr_address, pr_port, pr_latency_front, pr_latency_back = cs2_primary_router_match.group(
+        'pr_location', 'pr_host', 'pr_port', 'pr_latency_front', 'pr_latency_back'
+    )
+    _validate_cs2_relay_address(pr_address)
 
-    cs2_backup_router_match = _re_cs2_backup_router.search(text)
+    cs2_backup_router_match = matches.get('backup_relay')
     if not cs2_backup_router_match:
         raise ValueError('Could not find CS2 backup relay')
 
-    br_location, br_address, br_port, br_latency_front, br_latency_back = cs2_backup_router_match.groupdict().values()
+    br_location, br_address, br_port, br_latency_front, br_latency_back = cs2_backup_router_match.group(
+        'br_location', 'br_host', 'br_port', 'br_latency_front', 'br_latency_back'
+    )
+    _validate_cs2_relay_address(br_address)
 
     return {
         'server_location': server_location,
@@ -167,13 +393,8 @@ def parse_cs2_ncs(text):
 
 
 def open_path_in_explorer(path):
+    # Returns as soon as the shell has handled the path, instead of waiting for the explorer process
     try:
-        subprocess.run(
-            args=('explorer.exe', path),
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
-            text=True,
-            timeout=10
-        )
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+        os.startfile(path)
+    except OSError as e:
         raise OSError(f'Failed to open path in explorer: {e}') from e